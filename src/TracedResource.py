@@ -3,8 +3,12 @@ from simpy import Resource
 from operator import itemgetter
 import numpy as np
 
+from src.indexed_queue import IndexedQueue
+from src.results import ResourceLog
 
-class TracedResource(Resource):
+
+class TracedResource(Resource, ResourceLog):
+    PutQueue = IndexedQueue # requests are removed from anywhere in the queue when they are released before granted
 
     def __init__(self, env, capacity, name="Unnamed Resource", accociated_node=None):
         super().__init__(env, capacity)
@@ -14,11 +18,14 @@ class TracedResource(Resource):
 
         self.log_event = []
         self.log_time = []
+        self.capacity_log = [(env.now, capacity)] # (time, capacity) from that time on
 
-        self.customer_queue = [] # custom queue for finding customer information in the queue
+        self.customer_queue = IndexedQueue() # customers in order of their requests, the served ones first
 
         self.ucids = set({})
 
+        self.line = None # QueueLine of the waiting customers, if they queue up in front of the resource
+
     def request(self, customer=None):
         self.log_event.append(1)
         self.log_time.append(self.env.now)
@@ -33,17 +40,38 @@ class TracedResource(Resource):
             self.customer_queue.remove(customer)
         if request not in self.users:
             self.queue.remove(request)
-        return super().release(request)
+        release = super().release(request)
+        if self.line is not None:
+            # the next request is granted when the release is processed, the line moves up afterwards
+            release.callbacks.append(self.line.advance)
+        return release
+
+    def add_capacity(self, count):
+        # serve count more requests at a time, waiting requests are granted right away and the line moves up.
+        # simpy only grants a single request per trigger, so they are granted one by one until the capacity is used
+        self._capacity += count
+        # the change is logged as an event without demand, so the availability changes at that time
+        self.capacity_log.append((self.env.now, self._capacity))
+        self.log_event.append(0)
+        self.log_time.append(self.env.now)
+        while len(self.users) < self._capacity and self.put_queue:
+            self._do_put(self.put_queue.pop(0))
+        if self.line is not None:
+            self.line.advance()
+
+    def position(self, customer):
+        # position of the customer in the queue of the resource, the first count customers are served
+        return self.customer_queue.index(customer)
+
+    def is_served(self, customer):
+        # requests are granted first in first out, so the served customers are the first ones in the queue
+        return self.customer_queue.index(customer) < self.count
 
-    def availability(self):
-        demand = np.cumsum(np.asarray(self.log_event))
-        available = self.capacity - demand
-        return available, np.asarray(self.log_time)
+    def ahead(self, customer):
+        return self.customer_queue.ahead(customer)
 
-    def queue_length(self):
-        available, time = self.availability()
-        available[available > 0] = 0
-        return available * -1, time
+    def behind(self, customer):
+        return self.customer_queue.behind(customer)
 
     def plot_availability(self):
         fig, ax = plt.subplots()
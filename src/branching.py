@@ -0,0 +1,132 @@
+import os
+import pickle
+import traceback
+
+import simpy
+
+from src.queue_line import QueueLine
+from src.results import RunRecord
+from src.simulation import Simulation, setup_replication
+
+
+def add_checkout(node_id=None):
+    """
+    change opening an extra checkout lane. node_id is a free lane position of the checkout row, without it the first
+    free position is taken or a new one is added to the row (see Store.free_checkout_node)
+    """
+    def change(env, store, resources, customer_factory):
+        lane = store.checkouts.add_lane(store.path_grid.nodes[store.free_checkout_node(node_id)])
+        QueueLine(lane, store.path_grid, customer_factory.config["size"])
+    return change
+
+
+def add_clerks(department_id, count=1):
+    """
+    change adding clerks to a department with a queue. the availability of the department changes at the time of the
+    change, earlier statistics are computed with the clerks working before
+    """
+    def change(env, store, resources, customer_factory):
+        store.departments[department_id].queue.add_capacity(count)
+    return change
+
+
+def scale_arrivals(factor):
+    """
+    change scaling the arrival rate for the rest of the day
+    """
+    def change(env, store, resources, customer_factory):
+        customer_factory.scale_arrivals(factor)
+    return change
+
+
+def fork_branches(env, store, resources, customer_factory, changes):
+    """
+    fork a child process per change which applies it to the simulated prefix and finishes the day.
+    returns the RunRecord of every branch, collected through pipes. a change of None continues unchanged
+    """
+    children = []
+    for change in changes:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # child: finish the day and send the compact results or the traceback of the failure back, never return
+            # into the parent's code
+            status = 1
+            try:
+                os.close(read_fd)
+                try:
+                    if change is not None:
+                        change(env, store, resources, customer_factory)
+                    env.run()
+                    data = pickle.dumps((RunRecord.from_replication(resources, customer_factory, store.departments),
+                                         None), protocol=pickle.HIGHEST_PROTOCOL)
+                except BaseException:
+                    data = pickle.dumps((None, traceback.format_exc()), protocol=pickle.HIGHEST_PROTOCOL)
+                with os.fdopen(write_fd, "wb") as pipe:
+                    pipe.write(data)
+                status = 0
+            finally:
+                os._exit(status)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    results = []
+    for pid, read_fd in children:
+        with os.fdopen(read_fd, "rb") as pipe:
+            data = pipe.read()
+        _, status = os.waitpid(pid, 0)
+        results.append((pid, status, data))
+
+    records = []
+    for branch, (pid, status, data) in enumerate(results):
+        if status != 0 or not data:
+            raise RuntimeError(f"branch {branch} (process {pid}) died without sending its results")
+        record, error = pickle.loads(data)
+        if error is not None:
+            raise RuntimeError(f"branch {branch} (process {pid}) failed:\n{error}")
+        records.append(record)
+    return records
+
+
+def replay_branches(simulation, run, split_time, changes):
+    """
+    fallback for platforms without os.fork: every branch replays the shared prefix
+    """
+    records = []
+    for change in changes:
+        env = simpy.Environment()
+        store, resources, customer_factory = setup_replication(env, simulation.config,
+                                                               *simulation.replication_arguments(run))
+        env.run(until=split_time)
+        if change is not None:
+            change(env, store, resources, customer_factory)
+        env.run()
+        records.append(RunRecord.from_replication(resources, customer_factory, store.departments))
+    return records
+
+
+def run_branches(simulation, split_time, changes):
+    """
+    what-if branching: every run of the simulation is simulated once up to split_time, then forked into one branch per
+    change (a function of env, store, resources and customer factory, or None for the unchanged day).
+    returns a Simulation per change holding the results of its branches
+    """
+    if isinstance(simulation.config["Customer"]["flags"].get("trace", False), str) and len(changes) > 1:
+        # the branches of a run share its seed and with it the {replication} label of the trace file
+        raise ValueError("the branches would write the same trace files, trace in memory (true) instead")
+    branches = [Simulation(simulation.config, runs=0, seed=simulation.seed_sequence.entropy,
+                           common_random_numbers=simulation.common_random_numbers, antithetic=simulation.antithetic)
+                for _ in changes]
+    for run in range(simulation.runs):
+        if hasattr(os, "fork"):
+            env = simpy.Environment()
+            store, resources, customer_factory = setup_replication(env, simulation.config,
+                                                                   *simulation.replication_arguments(run))
+            env.run(until=split_time)
+            records = fork_branches(env, store, resources, customer_factory, changes)
+        else:
+            records = replay_branches(simulation, run, split_time, changes)
+        print(f"finished branches of run {run}")
+        for branch, record in zip(branches, records):
+            branch.add_record(record)
+    return branches
@@ -0,0 +1,128 @@
+import math
+
+from src.TracedResource import TracedResource
+
+
+class LoadTree:
+    """
+    segment tree over the lanes of one kind holding (load, lane index) pairs. the least loaded lane (the first one if
+    several are equally loaded) is at the root, updating the load of a lane is O(log n)
+    """
+
+    def __init__(self):
+        self.size = 1
+        self.count = 0
+        self.tree = [(math.inf, math.inf)] * 2
+
+    def append(self, value):
+        if self.count == self.size:
+            # double the number of leaves and rebuild the inner nodes
+            leaves = self.tree[self.size:] + [(math.inf, math.inf)] * self.size
+            self.size *= 2
+            self.tree = [(math.inf, math.inf)] * self.size + leaves
+            for i in range(self.size - 1, 0, -1):
+                self.tree[i] = min(self.tree[2 * i], self.tree[2 * i + 1])
+        self.count += 1
+        self.update(self.count - 1, value)
+        return self.count - 1
+
+    def update(self, position, value):
+        i = position + self.size
+        self.tree[i] = value
+        i //= 2
+        while i > 0:
+            self.tree[i] = min(self.tree[2 * i], self.tree[2 * i + 1])
+            i //= 2
+
+    def min(self):
+        return self.tree[1]
+
+
+class CheckoutLane(TracedResource):
+    """
+    checkout lane reporting its load (customers queued or served) to the checkout bank on every request and release
+    """
+
+    def __init__(self, env, bank, index, node, express=False):
+        name = f"Express checkout {index}" if express else f"Checkout {index}"
+        super().__init__(env, capacity=1, name=name, accociated_node=node)
+        self.bank = bank
+        self.index = index
+        self.express = express
+        self.leaf = None  # leaf of the lane in the load tree of its kind
+        self.served = 0
+
+    @property
+    def load(self):
+        return len(self.put_queue) + self.count
+
+    def request(self, customer=None):
+        request = super().request(customer)
+        self.bank.update(self)
+        return request
+
+    def release(self, request, customer=None):
+        if request in self.users:
+            self.served += 1
+        release = super().release(request, customer)
+        self.bank.update(self)
+        return release
+
+
+class CheckoutBank:
+    """
+    checkout lanes of the store. customers take the least loaded lane they may use, ties go to the first lane.
+    express lanes only serve customers with at most express_items items. the loads of the regular and the express
+    lanes are kept in a LoadTree each, so choosing a lane is O(log n) in the number of lanes
+    """
+
+    def __init__(self, env, nodes, express_nodes=(), express_items=10):
+        self.env = env
+        self.express_items = express_items
+        self.lanes = []
+        self.trees = {False: LoadTree(), True: LoadTree()}
+
+        # aggregated statistics, updated on every change of a load
+        self.loads = []
+        self.total_load = 0
+        self.load_integral = 0.0
+        self.changed = 0.0
+
+        for node in nodes:
+            self.add_lane(node)
+        for node in express_nodes:
+            self.add_lane(node, express=True)
+
+    def add_lane(self, node, express=False):
+        lane = CheckoutLane(self.env, self, len(self.lanes), node, express)
+        self.lanes.append(lane)
+        self.loads.append(0)
+        lane.leaf = self.trees[express].append((0, lane.index))
+        return lane
+
+    def update(self, lane):
+        self.load_integral += self.total_load * (self.env.now - self.changed)
+        self.changed = self.env.now
+        load = lane.load
+        self.total_load += load - self.loads[lane.index]
+        self.loads[lane.index] = load
+        self.trees[lane.express].update(lane.leaf, (load, lane.index))
+
+    def choose(self, items):
+        # least loaded lane a customer with the given number of items may use
+        load, index = self.trees[False].min()
+        if items <= self.express_items:
+            load, index = min((load, index), self.trees[True].min())
+        if load == math.inf:
+            raise ValueError(f"no checkout lane serves customers with {items} items")
+        return self.lanes[index]
+
+    def statistics(self):
+        """
+        aggregated lane statistics: number of lanes and express lanes, customers served per lane, the current total
+        load and the total load averaged over time
+        """
+        integral = self.load_integral + self.total_load * (self.env.now - self.changed)
+        return {"lanes": len(self.lanes), "express lanes": sum(lane.express for lane in self.lanes),
+                "served": [lane.served for lane in self.lanes], "load": self.total_load,
+                "average load": float(integral / self.env.now) if self.env.now > 0 else 0.0}
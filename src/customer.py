@@ -1,18 +1,22 @@
-from scipy.stats import truncnorm
-from operator import itemgetter
-from copy import deepcopy
-import numpy.random as npr
+from bisect import bisect_right
 import numpy as np
 import simpy
 
 from src.store import Store
+from src.pathing import Location
+from src.event_trace import EventTracer, ENTER, WALK, PICK, PICKED, LEAVE, CHECKOUT, SCAN, PAY
+from src.random_streams import RandomStreams, TruncatedNormal
 
 
 class Customer:
+    __slots__ = ("env", "resources", "store", "shopping_list", "basket", "route", "start_time", "size", "ucid",
+                 "streams", "stochastics", "tracer", "walking_speed", "congestion_routing", "wait_times", "use_times",
+                 "store_time", "walking", "walking_path", "_pos", "on_node", "location", "current_department_id",
+                 "reserved_edge", "request", "draw", "color", "action")
 
-    def __init__(self, env, stochastics:dict, store: Store, resources: dict, flags:dict,
+    def __init__(self, env, stochastics:dict, store: Store, resources: dict, tracer: EventTracer,
                  shopping_list: dict[str, int], basket: bool, route: str, start_time: float, walking_speed: float,
-                 size: float, ucid: int, seed: int):
+                 size: float, ucid: int, streams: RandomStreams, congestion_routing: bool = False):
         self.env = env
         self.resources = resources
         self.store = store
@@ -22,10 +26,12 @@ class Customer:
         self.start_time = start_time
         self.size = size
         self.ucid = ucid # unique customer id
-        self.rng = npr.default_rng(seed)
+        self.streams = streams # substreams of the stochastic sources of the customer
         self.stochastics = stochastics
-        self.flags = deepcopy(flags)
+        self.tracer = tracer # event trace shared by all customers, None if tracing is off
         self.walking_speed = walking_speed # walking speed in m/s
+        # customers with a cart look for a detour when the narrow aisle ahead of them is occupied
+        self.congestion_routing = congestion_routing
         # initialize wait times and use times of resources
         self.wait_times = {}
         self.use_times = {}
@@ -33,15 +39,14 @@ class Customer:
 
         # Everything related to allowing customers to walk
         self.walking = False
-        self.walking_start_time = 0.0
-        self.walking_direction = np.zeros(2, dtype=np.float64)
+        self.walking_path = None # start times, start points and velocities of the segments of the current walk
         self._pos = np.zeros(2, dtype=np.float64)
         self.on_node = None # None if not on a node otherwise equal to node id
+        self.location = None # Location the customer is standing at if it was reached as one
         self.current_department_id = None
-        self.reserved_edge = None # tuple of the reserved edge for carts and the simpy request object or None
+        self.reserved_edge = None # narrow edge reserved by a customer with a cart or None
 
         self.request = None # memory for requests created by
-        self.queue_process = None
 
         self.draw = False
         self.color = (0, 0, 255)
@@ -52,7 +57,10 @@ class Customer:
     def pos(self):
         if not self.walking:
             return self._pos
-        return self._pos + self.walking_direction * (self.env.now - self.walking_start_time)
+        # position on the polyline of the current walk, evaluated lazily
+        times, points, directions = self.walking_path
+        i = bisect_right(times, self.env.now) - 1
+        return points[i] + directions[i] * (self.env.now - times[i])
 
     @property
     def total_items(self):
@@ -67,83 +75,118 @@ class Customer:
         # the time the customer exits the store
         return self.store_time + self.start_time
 
-    def walk(self, destination):
-        # customer sub process for walking from one location to the next
-        self.walking_start_time = self.env.now
-        walking_time = np.linalg.norm(destination - self.pos) / self.walking_speed
-        self.walking_direction = (destination - self.pos) / walking_time
+    def walk(self, stops):
+        """
+        customer sub process for walking along the positions of the given stops without stopping in between, a single
+        timeout covers the whole polyline. the arrival time is accumulated hop by hop like walking to every stop on its
+        own
+        """
+        times = []
+        points = []
+        directions = []
+        arrival = self.env.now
+        previous = self.pos
+        for _, destination in stops:
+            walking_time = np.linalg.norm(destination - previous) / self.walking_speed
+            times.append(arrival)
+            points.append(previous)
+            directions.append((destination - previous) / walking_time)
+            arrival += walking_time
+            previous = destination
+        self.walking_path = (times, points, directions)
         self.walking = True
-        yield self.env.timeout(walking_time)
+        yield self.env.timeout(walking_time if len(stops) == 1 else arrival - self.env.now)
         self.walking = False
         # only update location after arrival not during walking
-        self._pos = destination
+        self._pos = previous
+
+    def blocking_edge(self, previous, stop, location, dep):
+        """
+        narrow edge a customer with a cart has to request before moving from node previous (None if off the graph) to
+        the node or position of stop, None if the move is uncontended
+        """
+        if self.basket:
+            return None
+        node_id, pos = stop
+        if node_id is not None:
+            if previous is None:
+                return None
+            edge = self.store.path_grid.nodes[node_id].incoming_edges[previous]
+        else:
+            if self.reserved_edge is not None:
+                return None  # the edge is held already
+            edge = location.edge if location is not None else self.store.path_grid.get_closest_edge(pos, dep)
+        if not edge.narrow:
+            return None
+        return edge
 
     def path_to(self, destination, dep=None):
         """
         path to the given destination.
-        destination can be a position or index of a node in the path grid
+        destination can be a position, a Location or index of a node in the path grid
         """
         try:
             if self.on_node is None:
-                path = self.store.path_grid.dijkstra(self.pos, destination, self.current_department_id, dep)
+                start = self.location if self.location is not None else self.pos
+                path = self.store.path_grid.route(start, destination, self.current_department_id, dep)
             else:
-                path = self.store.path_grid.dijkstra(self.on_node, destination, self.current_department_id, dep)
+                path = self.store.path_grid.route(self.on_node, destination, self.current_department_id, dep)
+            self.location = None
+            location = destination if isinstance(destination, Location) else None
+            if location is not None:
+                destination = location.pos
 
             if path is None:
-                print(self.ucid) # debug feature, should only trigger if dijkstra failed to find a path
+                print(self.ucid) # debug feature, should only trigger if no path was found
 
+            # stops along the path as (node id, position), an item location which is not on a static node has no id
+            nodes = self.store.path_grid.nodes
             if not isinstance(destination, int):
-                path = path[:-1]
-
-            for node_id in path:
-                node = self.store.path_grid.nodes[node_id]
-                if not self.basket and self.on_node is not None:
-                    edge = node.incoming_edges[self.on_node]
-                    if edge.blockage is not None:
-                        # customer with a cart requests to use the edge to move to their destination
-                        req = edge.blockage.request(self)
-                        self.reserved_edge = (edge, req)
+                stops = [(node_id, nodes[node_id].pos) for node_id in path[:-1]] + [(None, destination)]
+            else:
+                stops = [(node_id, nodes[node_id].pos) for node_id in path]
+
+            k = 0
+            replanned = False
+            while k < len(stops):
+                edge = self.blocking_edge(self.on_node, stops[k], location, dep)
+                if edge is not None:
+                    if self.congestion_routing and not replanned and stops[k][0] is not None and \
+                            self.store.path_grid.reservations.occupied(edge):
+                        # the narrow edge ahead is occupied, look for a detour to the last node of the path once
+                        replanned = True
+                        end = len(stops) if stops[-1][0] is not None else len(stops) - 1
+                        detour = self.store.path_grid.congested_path(self.on_node, stops[end - 1][0])
+                        if detour is not None and detour[0] != stops[k][0]:
+                            stops[k:end] = [(node_id, nodes[node_id].pos) for node_id in detour]
+                            continue
+                    # customer with a cart requests to use the edge to move to their destination
+                    # an edge requested on the way to an item location is held while collecting the item
+                    granted = self.store.path_grid.reservations.reserve(edge, self)
+                    self.reserved_edge = edge
+                    if granted is not None:
+                        # the edge is in use, wait for it
                         self.color = (255, 0, 0)
-                        yield req
+                        yield granted
                         self.color = (0, 0, 255)
-                # customer walking to the next node
-                self.walking_start_time = self.env.now
-                walking_time = np.linalg.norm(node.pos - self.pos) / self.walking_speed
-                self.walking_direction = (node.pos - self.pos) / walking_time
-                self.walking = True
-                yield self.env.timeout(walking_time)
-                self.walking = False
-                # only update location after arrival not during walking
-                self._pos = node.pos
-
-                if self.reserved_edge is not None:
+
+                # uncontended stops after this one are walked in one go, an edge in use is left at the next stop
+                end = k + 1
+                if self.reserved_edge is None:
+                    while end < len(stops) and self.blocking_edge(stops[end - 1][0], stops[end], location, dep) is None:
+                        end += 1
+                yield from self.walk(stops[k:end])
+
+                node_id = stops[end - 1][0]
+                if node_id is not None and self.reserved_edge is not None:
                     # request is released once customer hase left the edge
-                    self.reserved_edge[0].blockage.release(self.reserved_edge[1], self)
+                    self.store.path_grid.reservations.release(self.reserved_edge, self)
                     self.reserved_edge = None
                 self.on_node = node_id
-
-            if not isinstance(destination, int):
-                # move to an item location which is not on a static node
-                if not self.basket:
-                    edge = self.store.path_grid.get_closest_edge(destination, dep)
-                    if self.reserved_edge is None and edge.blockage is not None:
-                        # customer will hold an edge even when collecting an item hence no release here
-                        req = edge.blockage.request(self)
-                        self.reserved_edge = (edge, req)
-                        self.color = (255, 0, 0)
-                        yield req
-                        self.color = (0, 0, 255)
-
-                # customer walking to the final destination
-                self.walking_start_time = self.env.now
-                walking_time = np.linalg.norm(destination - self.pos) / self.walking_speed
-                self.walking_direction = (destination - self.pos) / walking_time
-                self.walking = True
-                yield self.env.timeout(walking_time)
-                self.walking = False
-                # only update location after arrival not during walking
-                self._pos = destination
-                self.on_node = None
+                if node_id is None:
+                    self.location = location
+                replanned = False
+                k = end
             self.current_department_id = dep
         except simpy.Interrupt:
             # pathing was interrupted => set current pos and reset walking state
@@ -152,61 +195,46 @@ class Customer:
             self.on_node = None
             if self.reserved_edge is not None:
                 # request is released aswell
-                self.reserved_edge[0].blockage.release(self.reserved_edge[1], self)
+                self.store.path_grid.reservations.release(self.reserved_edge, self)
                 self.reserved_edge = None
 
+    def step_to(self, destination):
+        """
+        move up to destination in a line. like a walk but without an event, the position is evaluated lazily
+        """
+        start = self.pos
+        walking_time = np.linalg.norm(destination - start) / self.walking_speed
+        if walking_time == 0.0:
+            return
+        self.walking_path = ([self.env.now, self.env.now + walking_time], [start, destination],
+                             [(destination - start) / walking_time, np.zeros(2)])
+        self.walking = True
+
     def queue(self, resource):
+        """
+        request a resource and get in its line if it has no capacity left. the customer walks to its slot and is
+        moved up by the line, once served it walks to the resource node
+        """
         self.request = resource.request(self)
-        while True:
-            if self in resource.customer_queue[:resource.capacity]:
-                # resource has open capacity
-                yield self.request & self.env.process(self.path_to(resource.node.unid))
-                if len(resource.customer_queue) > resource.capacity and \
-                        self == resource.customer_queue[resource.capacity - 1]:
-                    # customer is "last currently served customer"
-                    next_customer = resource.customer_queue[resource.capacity]
-                    next_customer.queue_process.interrupt() # signal next customer in line that pathing can be updated
-                break
-            else:
-                prev_customer = resource.customer_queue[resource.customer_queue.index(self) - 1]
-                delta_pos = prev_customer.pos - self.pos
-                if np.linalg.norm(delta_pos) >= self.size:
-                    dest = prev_customer.pos - delta_pos * self.size / np.linalg.norm(delta_pos)
-                    pathing = self.env.process(self.path_to(dest))
-                    try:
-                        yield self.request | pathing
-                        if self.request.triggered:
-                            #interrupt current pathing and start a new one with the updated destination
-                            pathing.interrupt()
-                            pathing = self.env.process(self.path_to(resource.node.unid))
-                            yield pathing
-                            if len(resource.customer_queue) > resource.capacity and \
-                                    self == resource.customer_queue[resource.capacity - 1]:
-                                # customer is "last currently served customer"
-                                next_customer = resource.customer_queue[resource.capacity]
-                                # signal next customer in line that pathing can be updated
-                                next_customer.queue_process.interrupt()
-                            break
-                        if resource.customer_queue.index(self) + 1 < len(resource.customer_queue):
-                            next_customer = resource.customer_queue[resource.customer_queue.index(self) + 1]
-                                # signal customer behind self in line that pathing should be updated
-                            next_customer.queue_process.interrupt()
-                        yield self.request
-                    except simpy.Interrupt:
-                        if pathing.is_alive:
-                            pathing.interrupt()
-                else:
-                    try:
-                        yield self.request
-                    except simpy.Interrupt:
-                        pass
-
-
+        if self.request.triggered:
+            # resource has open capacity
+            yield self.request & self.env.process(self.path_to(resource.node.unid))
+            return
+
+        walking = self.env.process(self.path_to(resource.line.join(self)))
+        yield self.request | walking
+        if not self.request.triggered:
+            resource.line.arrive(self)
+            yield self.request
+        elif walking.is_alive:
+            walking.interrupt()
+        yield self.env.process(self.path_to(resource.node.unid))
 
     # MAIN CUSTOMER ROUTINE FUNCTION
     def run(self):
-        # wait to enter the store
-        yield self.env.timeout(self.start_time)
+        # wait to enter the store, customers of the factory are only created on arrival
+        if self.start_time > self.env.now:
+            yield self.env.timeout(self.start_time - self.env.now)
 
         # customer has entered the store so we start drawing it
         self.draw = True
@@ -238,96 +266,84 @@ class Customer:
                 # log department entry
                 current_department.log_event.append(1)
                 current_department.log_time.append(self.env.now)
-                if self.flags["print"]:
-                    print('{:.2f}: {} enters department {}'.format(self.env.now, self.ucid,
-                                                                   current_department.name))
+                if self.tracer is not None:
+                    self.tracer.record(self.env.now, self.ucid, ENTER, department_id)
 
                 if current_department.queue is not None:
                     # departments with queue
                     self.color = (255, 0, 0)
-                    self.queue_process = self.env.process(self.queue(current_department.queue))
-                    yield self.queue_process
-                    self.queue_process = None
+                    yield from self.queue(current_department.queue)
                     self.color = (0, 255, 0)
                     self.wait_times[department_id] = self.env.now - department_wait
                     department_use = self.env.now
-                    yield self.env.timeout(current_department.rv.rvs(random_state=self.rng.integers(0, 2**32 - 1)))
+                    yield self.env.timeout(self.streams.sample(f"service_{department_id}", current_department.rv))
                     current_department.queue.release(self.request, self)
                     self.request = None
                 else:
                     # departments with no queue
                     self.wait_times[department_id] = self.env.now - department_wait
                     department_use = self.env.now
-                    for i in range(self.shopping_list[department_id]):
-                        item_pos = current_department.get_item_location(self.rng)
-
-                        if self.flags["print"] and department_id == "G":
-                            print('{:.2f}: {} walking from ({:.2f},{:.2f}) to ({:.2f},{:.2f})'.format(
-                                self.env.now, self.ucid, self.pos[0], self.pos[1], item_pos[0], item_pos[1]))
-                        walking = self.env.process(self.path_to(item_pos, department_id))
+                    # item locations of the department are drawn at once and come with their closest edge
+                    locations = self.store.path_grid.locate_many(
+                        current_department.get_item_locations(self.streams["item_location"],
+                                                              self.shopping_list[department_id]), department_id)
+                    for location in locations:
+                        item_pos = location.pos
+
+                        if self.tracer is not None:
+                            self.tracer.record(self.env.now, self.ucid, WALK, department_id, *self.pos, *item_pos)
+                        walking = self.env.process(self.path_to(location, department_id))
                         self.color = (0, 0, 255)
                         yield walking
                         self.color = (0, 255, 0)
-                        if self.flags["print"]:
-                            print('{:.2f}: {} picks up item at ({:.2f},{:.2f})'.format(self.env.now, self.ucid,
-                                                                                       item_pos[0], item_pos[1]))
-                        yield self.env.timeout(self.rng.uniform(self.stochastics["search_bounds"][0],
-                                                                self.stochastics["search_bounds"][1]))
-                    if self.flags["print"]:
-                        print('{:.2f}: {} picked {} items at department {} in {:.2f} seconds'.format(self.env.now,
-                                                                                                     self.ucid,
-                                                                                                     self.shopping_list[
-                                                                                                         department_id],
-                                                                                                     department_id,
-                                                                                                     self.env.now - department_wait))
+                        if self.tracer is not None:
+                            self.tracer.record(self.env.now, self.ucid, PICK, department_id, *item_pos)
+                        yield self.env.timeout(self.streams["search"].uniform(self.stochastics["search_bounds"][0],
+                                                                              self.stochastics["search_bounds"][1]))
+                    if self.tracer is not None:
+                        self.tracer.record(self.env.now, self.ucid, PICKED, department_id, u=self.shopping_list[
+                            department_id], v=self.env.now - department_wait)
 
                 # log department exit
                 current_department.log_event.append(-1)
                 current_department.log_time.append(self.env.now)
-                if self.flags["print"]:
-                    print('{:.2f}: {} leaves department {}'.format(self.env.now, self.ucid, department_id))
+                if self.tracer is not None:
+                    self.tracer.record(self.env.now, self.ucid, LEAVE, department_id)
                 self.use_times[department_id] = self.env.now - department_use
 
-            # checkout
-            if self.flags["print"]:
-                print('{:.2f}: {} enters checkout'.format(self.env.now, self.ucid))
-
-            # find the shortest queue
-            idx, _ = min(enumerate(len(ch.put_queue) + ch.count for ch in self.resources["checkout"]),
-                         key=itemgetter(1))
-            checkout = self.resources["checkout"][idx]
-
+            # checkout, the least loaded lane the customer may use
+            checkout = self.store.checkouts.choose(self.total_items)
+            if self.tracer is not None:
+                self.tracer.record(self.env.now, self.ucid, CHECKOUT, u=checkout.index)
 
             checkout_wait = self.env.now
             self.color = (255, 0, 0)
-            self.queue_process = self.env.process(self.queue(checkout))
-            yield self.queue_process
-            self.queue_process = None
+            yield from self.queue(checkout)
             self.color = (0, 255, 0)
             self.wait_times["checkout"] = self.env.now - checkout_wait
             checkout_use = self.env.now
 
-            if self.flags["print"]:
-                print('{:.2f}: {} scans items at checkout'.format(self.env.now, self.ucid))
+            if self.tracer is not None:
+                self.tracer.record(self.env.now, self.ucid, SCAN)
 
-            t_scan = truncnorm.rvs(-4, 4, loc=self.stochastics["scan_vars"][0],
-                                   scale=self.stochastics["scan_vars"][1],
-                                   random_state=self.rng.integers(0, 2**32 - 1), size=self.total_items)
+            t_scan = self.streams.sample("scan", TruncatedNormal(-4, 4, loc=self.stochastics["scan_vars"][0],
+                                                                 scale=self.stochastics["scan_vars"][1]),
+                                         size=self.total_items)
             yield self.env.timeout(np.sum(t_scan))
 
             # cashier has to ask for price
-            if self.rng.uniform(0.0, 1.0) < 0.05:
-                yield self.env.timeout(self.rng.exponential(12))
+            if self.streams["scan"].uniform(0.0, 1.0) < 0.05:
+                yield self.env.timeout(self.streams["scan"].exponential(12))
 
-            if self.flags["print"]:
-                print('{:.2f}: {} pays at checkout'.format(self.env.now, self.ucid))
+            if self.tracer is not None:
+                self.tracer.record(self.env.now, self.ucid, PAY)
 
-            yield self.env.timeout(self.rng.uniform(self.stochastics["payment_bounds"][0],
-                                                    self.stochastics["payment_bounds"][1]))
+            yield self.env.timeout(self.streams["payment"].uniform(self.stochastics["payment_bounds"][0],
+                                                                   self.stochastics["payment_bounds"][1]))
 
             # cashier has to check payment
-            if self.rng.uniform(0.0, 1.0) < 0.02:
-                yield self.env.timeout(self.rng.uniform(30, 45))
+            if self.streams["payment"].uniform(0.0, 1.0) < 0.02:
+                yield self.env.timeout(self.streams["payment"].uniform(30, 45))
 
             self.use_times["checkout"] = self.env.now - checkout_use
             checkout.release(self.request, self)
@@ -1,22 +1,77 @@
 from numpy import random as npr
 import numpy as np
+from functools import partial
 import json
-import sys
+import simpy
 
 
 from src.customer import Customer
+from src.event_trace import EventTracer
+from src.random_streams import CUSTOMER_SOURCES, PhiloxBlocks, RandomStreams, triangular_ppf
+from src.results import CustomerLog, CustomerTable
 
 
-class CustomerFactory:
+class ArrivalTable:
+    """
+    struct of arrays holding the arrival time and attributes of customers, one row per customer
+    """
 
-    def __init__(self, env, customer_config, store, resources, seed=0):
+    def __init__(self, times, ucids, items, baskets, routes, walking_speeds):
+        self.times = times
+        self.ucids = ucids
+        self.items = items  # number of items per customer and department
+        self.baskets = baskets
+        self.routes = routes  # index into the routes of the factory
+        self.walking_speeds = walking_speeds
+
+    def __len__(self):
+        return len(self.times)
+
+    def select(self, rows):
+        return ArrivalTable(self.times[rows], self.ucids[rows], self.items[rows], self.baskets[rows],
+                            self.routes[rows], self.walking_speeds[rows])
+
+    def sorted(self):
+        # by arrival time, ties are broken by the customer id
+        return self.select(np.lexsort((self.ucids, self.times)))
+
+    @classmethod
+    def concatenate(cls, tables, departments=0):
+        if not tables:
+            return cls(np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros((0, departments), dtype=np.int64),
+                       np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int64), np.zeros(0))
+        return cls(*[np.concatenate(columns) for columns in zip(*[(t.times, t.ucids, t.items, t.baskets, t.routes,
+                                                                    t.walking_speeds) for t in tables])])
+
+
+class CustomerFactory(CustomerLog):
+
+    def __init__(self, env, customer_config, store, resources, seed=0, common_random_numbers=False,
+                 antithetic=None):
         self.env = env
         self.rng = npr.default_rng(seed)
 
+        # with common random numbers the arrivals of every hour draw from their own substreams as well, so the same
+        # customers arrive in every scenario. antithetic replications (antithetic is False or True for the mirrored
+        # member of a pair) require them as well
+        self.antithetic = antithetic
+        self.common_random_numbers = common_random_numbers or antithetic is not None
+        self.seed_sequence = seed if isinstance(seed, npr.SeedSequence) else npr.SeedSequence(seed)
+        # Philox key of the substreams, every customer draws from substreams of its own in both modes
+        self.stream_key = self.seed_sequence.generate_state(2, np.uint64)
+        self.stream_blocks = PhiloxBlocks(self.stream_key)  # draws the blocks of all substreams
+        self.customer_sources = CUSTOMER_SOURCES + tuple(f"service_{name}" for name, department in
+                                                         store.departments.items() if department.queue is not None)
+
         self.store = store
         self.resources = resources
 
-        self.customers = []
+        self.customers = dict() # customers currently in the store by id, they are retired into the table on exit
+        self.customer_table = CustomerTable(["container"] + list(store.departments.keys()) + ["checkout"])
+        self.arrival_table = ArrivalTable.concatenate([]) # arrivals of the day sorted by arrival time
+        self.next_arrival = 0 # row of the next arrival in the table
+        self.next_ucid = 0
+        self.arrival_process = None
 
         # customer_config can be either a path or a dictionary
         if isinstance(customer_config, dict):
@@ -25,6 +80,19 @@ class CustomerFactory:
             with open(customer_config) as config: # if it's a path, read the file
                 self.config = json.load(config)["Customer"]
 
+        # event trace of the customers, "print" renders it to the console, "trace" is the path of a trace file
+        # ({replication} is replaced by the spawn key of the seed, required for more than one run) or true to keep the
+        # latest events in memory. printed events appear as they happen, the trace file is written in chunks of
+        # "trace capacity" events
+        flags = self.config["flags"]
+        trace = flags.get("trace", False)
+        if flags["print"] or trace:
+            path = trace.format(replication=self.replication_label()) if isinstance(trace, str) else None
+            self.tracer = EventTracer({key: department.name for key, department in store.departments.items()},
+                                      capacity=flags.get("trace capacity", 65536), path=path, echo=flags["print"])
+        else:
+            self.tracer = None
+
         self.shopping_list = {}
         for dep in self.config["items"].keys():
             self.shopping_list[dep] = {}
@@ -38,76 +106,132 @@ class CustomerFactory:
                                                                           self.config["items"][dep][0] + 1), 0.0])
             # correct for slight errors in interploation to ensure P(omega)=1
             self.shopping_list[dep]["probabilities"] /= np.sum(self.shopping_list[dep]["probabilities"])
+            # the cumulative distribution is normalized like in rng.choice
+            self.shopping_list[dep]["cdf"] = np.cumsum(self.shopping_list[dep]["probabilities"])
+            self.shopping_list[dep]["cdf"] /= self.shopping_list[dep]["cdf"][-1]
 
         self.routes = []
         self.route_probabilities = []
         for route in self.config["route"].keys():
             self.routes.append(route)
             self.route_probabilities.append(self.config["route"][route])
+        self.route_cdf = np.cumsum(self.route_probabilities)
+        self.route_cdf /= self.route_cdf[-1]
 
     def run(self):
-        ucid = 0
+        """
+        draw the arrivals of the whole day, one vectorized pass per hour, and start the arrival process which creates
+        every customer only once it enters the store
+        """
+        tables = []
         for k, v in enumerate(self.config["arrivals"][:-1]):
-            count = self.rng.poisson(v[1])
-            for _ in range(count):
-                self.customers.append(self.create_customer(k, ucid))
-                ucid +=1
-
-    def create_customer(self, hour, ucid) -> Customer:
-        t = self.rng.uniform(self.config["arrivals"][hour][0], self.config["arrivals"][hour + 1][0])
-        shopping_list = {}
-        for dep in self.shopping_list.keys():
-            shopping_list[dep] = int(self.rng.choice(self.shopping_list[dep]["items"],
-                                                     p=self.shopping_list[dep]["probabilities"]))
-        basket = bool(self.rng.binomial(1, self.config["basket"]))
-        route = self.rng.choice(self.routes, p=self.route_probabilities)
-        seed = self.rng.integers(0, sys.maxsize)
-
-        if basket:
-            walking_speed = self.rng.uniform(self.config["stochastics"]["walking_basket"][0],
-                                             self.config["stochastics"]["walking_basket"][1]) / 3.6 # convert km/h to m/s
+            if self.common_random_numbers:
+                streams = RandomStreams(root=self.stream_key, key=(k,), antithetic=self.antithetic,
+                                        blocks=self.stream_blocks)
+                count = streams["arrival_counts"].poisson(v[1])
+            else:
+                count = self.rng.poisson(v[1])
+            tables.append(self.draw_arrivals(k, self.next_ucid, count))
+            self.next_ucid += count
+        self.arrival_table = ArrivalTable.concatenate(tables, len(self.shopping_list)).sorted()
+        self.next_arrival = 0
+        self.customer_table.reserve(len(self.arrival_table))
+        self.arrival_process = self.env.process(self.arrivals())
+
+    def arrivals(self):
+        # create the customers of the arrival table in order of their arrival time
+        while self.next_arrival < len(self.arrival_table):
+            try:
+                yield self.env.timeout(self.arrival_table.times[self.next_arrival] - self.env.now)
+            except simpy.Interrupt:
+                continue  # the arrival table was changed
+            customer = self.create_customer(self.arrival_table, self.next_arrival)
+            self.customers[customer.ucid] = customer
+            customer.action.callbacks.append(partial(self.retire, customer))
+            self.next_arrival += 1
+
+    def retire(self, customer, _):
+        # the customer left the store, only its results are kept
+        self.customer_table.add(customer)
+        del self.customers[customer.ucid]
+        if self.tracer is not None and not self.customers and self.next_arrival == len(self.arrival_table):
+            self.tracer.close()  # the last customer of the day left
+
+    def replication_label(self):
+        # spawn key of the seed, mirrored members of antithetic pairs get an "a"
+        return "-".join(str(key) for key in self.seed_sequence.spawn_key) + ("a" if self.antithetic else "")
+
+    def scale_arrivals(self, factor):
+        """
+        change the arrival rate of all customers arriving after the current time by the given factor.
+        customers are removed by thinning or added as an extra poisson stream for the remainder of each hour
+        """
+        pending = self.arrival_table.select(slice(self.next_arrival, None))
+        if factor < 1.0:
+            # thinning draws are assigned in order of the customer ids
+            keep = np.empty(len(pending), dtype=bool)
+            keep[np.argsort(pending.ucids)] = self.rng.uniform(0.0, 1.0, len(pending)) < factor
+            pending = pending.select(keep)
         else:
-            walking_speed = self.rng.triangular(self.config["stochastics"]["walking_cart"][0],
-                                                self.config["stochastics"]["walking_cart"][1],
-                                                self.config["stochastics"]["walking_cart"][2],) / 3.6
-
-        return Customer(self.env, self.config["stochastics"], self.store, self.resources, self.config["flags"],
-                        shopping_list, basket, route, t, walking_speed, self.config["size"], ucid, seed)
-
-    def wait_times(self, key):
-        if key == "baskets":
-            return np.asarray([c.wait_times["container"] for c in self.customers if c.basket])
-        elif key == "shopping_carts":
-            return np.asarray([c.wait_times["container"] for c in self.customers if not c.basket and "container" in c.wait_times.keys()])
-        return np.asarray([c.wait_times[key] for c in self.customers if key in c.wait_times.keys()])
-
-    def use_times(self, key):
-        if key == "baskets":
-            return np.asarray([c.use_times["container"] for c in self.customers if c.basket])
-        elif key == "shopping_carts":
-            return np.asarray([c.use_times["container"] for c in self.customers if not c.basket and "container" in c.use_times.keys()])
-        return np.asarray([c.use_times[key] for c in self.customers if key in c.use_times.keys()])
-
-    def total_times(self, key):
-        if key == "baskets":
-            return np.asarray([c.total_time("container") for c in self.customers if c.basket])
-        elif key == "shopping_carts":
-            return np.asarray([c.total_time("container") for c in self.customers if not c.basket and "container" in c.use_times.keys() and "container" in c.wait_times.keys()])
-        return np.asarray([c.total_time(key) for c in self.customers if key in c.use_times.keys() and key in c.wait_times.keys()])
-
-    @property
-    def store_times(self):
-        """ time spent in the store """
-        return np.asarray([c.store_time for c in self.customers])
-
-    @property
-    def start_times(self):
-        return np.asarray([c.start_time for c in self.customers])
-
-    @property
-    def simulation_end_time(self):
-        # total simulation runs from zero until the last customer leaves the store
-        return max([c.exit_time for c in self.customers])
-
-
-
+            tables = [pending]
+            for k, v in enumerate(self.config["arrivals"][:-1]):
+                end = self.config["arrivals"][k + 1][0]
+                if end <= self.env.now:
+                    continue
+                remaining = (end - max(v[0], self.env.now)) / (end - v[0])
+                count = self.rng.poisson((factor - 1.0) * v[1] * remaining)
+                tables.append(self.draw_arrivals(k, self.next_ucid, count, earliest=self.env.now))
+                self.next_ucid += count
+            pending = ArrivalTable.concatenate(tables).sorted()
+            self.customer_table.reserve(len(self.customer_table) + len(self.customers) + len(pending))
+        self.arrival_table = pending
+        self.next_arrival = 0
+
+        # the arrival process waits for the next arrival of the old table, wake it up to wait for the new one
+        if self.arrival_process.is_alive:
+            self.arrival_process.interrupt()
+        elif len(pending) > 0:
+            self.arrival_process = self.env.process(self.arrivals())
+
+    def draw_arrivals(self, hour, first_ucid, count, earliest=None) -> ArrivalTable:
+        """
+        draw the arrival times and attributes of count customers arriving in the given hour at once. every attribute
+        is drawn by inversion of a block of uniform numbers
+        """
+        if self.common_random_numbers:
+            # the customers of an hour share substreams, extra customers added later are keyed by their first id
+            key = (hour,) if earliest is None else (hour, first_ucid)
+            streams = RandomStreams(root=self.stream_key, key=key, antithetic=self.antithetic,
+                                    blocks=self.stream_blocks)
+        else:
+            streams = RandomStreams(self.rng)
+
+        start = self.config["arrivals"][hour][0]
+        if earliest is not None:
+            start = max(earliest, start)
+        times = streams["arrivals"].uniform(start, self.config["arrivals"][hour + 1][0], count)
+        u = streams["shopping_list"].random((count, len(self.shopping_list)))
+        items = np.empty((count, len(self.shopping_list)), dtype=np.int64)
+        for j, dep in enumerate(self.shopping_list.keys()):
+            items[:, j] = self.shopping_list[dep]["items"][self.shopping_list[dep]["cdf"].searchsorted(u[:, j],
+                                                                                                     side="right")]
+        baskets = streams["basket"].random(count) < self.config["basket"]
+        routes = self.route_cdf.searchsorted(streams["route"].random(count), side="right")
+
+        u = streams["walking_speed"].random(count)
+        walking_basket = self.config["stochastics"]["walking_basket"]
+        walking_cart = self.config["stochastics"]["walking_cart"]
+        walking_speeds = np.where(baskets, walking_basket[0] + (walking_basket[1] - walking_basket[0]) * u,
+                                  triangular_ppf(u, *walking_cart[:3])) / 3.6 # convert km/h to m/s
+
+        return ArrivalTable(times, np.arange(first_ucid, first_ucid + count), items, baskets, routes, walking_speeds)
+
+    def create_customer(self, table, row) -> Customer:
+        ucid = int(table.ucids[row])
+        streams = RandomStreams(root=self.stream_key, key=(ucid,), antithetic=self.antithetic,
+                                blocks=self.stream_blocks, sources=self.customer_sources)
+        shopping_list = {dep: int(n) for dep, n in zip(self.shopping_list.keys(), table.items[row])}
+        return Customer(self.env, self.config["stochastics"], self.store, self.resources, self.tracer,
+                        shopping_list, bool(table.baskets[row]), self.routes[table.routes[row]],
+                        float(table.times[row]), float(table.walking_speeds[row]), self.config["size"], ucid, streams,
+                        congestion_routing=self.config.get("congestion_routing", False))
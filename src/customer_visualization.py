@@ -63,7 +63,7 @@ class Visualization:
 
     def draw_customers(self, env):
         customer_in_store = []
-        for c in self.customer_factory.customers:
+        for c in self.customer_factory.customers.values():
             if c.draw: # and c.ucid == 14:
                 customer_in_store.append(c.ucid)
                 if c.basket:
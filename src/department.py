@@ -1,5 +1,5 @@
 from src.TracedResource import TracedResource
-from scipy.stats import truncnorm
+from src.random_streams import TruncatedNormal
 
 import numpy as np
 
@@ -15,7 +15,7 @@ class Department:
 
         if queue is not None and times is not None:
             self.queue = TracedResource(env, capacity=queue, name=name, accociated_node=node)
-            self.rv = truncnorm(-4, 4, loc=times[0], scale=times[1])
+            self.rv = TruncatedNormal(-4, 4, loc=times[0], scale=times[1])
         else:
             self.queue = None
             self.times = None
@@ -24,15 +24,33 @@ class Department:
 
         self.probabilities = np.asarray([s.length for s in self.shelves])
         self.probabilities /= np.sum(self.probabilities)
+        self.build_shelf_table()
 
     def scale(self, old, new):
         # scale using old and new extends of the store
         for shelf in self.shelves:
             shelf.scale(old, new)
+        self.build_shelf_table()
+
+    def build_shelf_table(self):
+        # shelf start points and deltas as arrays, the cumulative distribution is normalized like in rng.choice
+        self.shelf_starts = np.asarray([shelf.start for shelf in self.shelves], dtype=np.float64).reshape(-1, 2)
+        self.shelf_deltas = np.asarray([shelf.delta for shelf in self.shelves], dtype=np.float64).reshape(-1, 2)
+        self.shelf_cdf = np.cumsum(self.probabilities)
+        if len(self.shelf_cdf) > 0:
+            self.shelf_cdf /= self.shelf_cdf[-1]
 
     def get_item_location(self, rng):
-        shelf = rng.choice(self.shelves, p=self.probabilities)
-        return shelf.relative_position(rng.uniform(0 , 1))
+        return self.get_item_locations(rng, 1)[0]
+
+    def get_item_locations(self, rng, count):
+        """
+        draw the locations of count items at once. the shelf is picked proportional to its length and the location is
+        uniform along the shelf, using the same random numbers in the same order as picking the items one by one
+        """
+        u = rng.random((count, 2))
+        shelves = self.shelf_cdf.searchsorted(u[:, 0], side="right")
+        return self.shelf_starts[shelves] + u[:, 1:] * self.shelf_deltas[shelves]
 
     def customers_inside(self):
         return np.cumsum(np.asarray(self.log_event)), np.asarray(self.log_time)
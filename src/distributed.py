@@ -0,0 +1,222 @@
+"""
+multi-node replication runner using a queue directory on a shared filesystem.
+
+the coordinator writes one file per (scenario, run) job into <queue>/pending, named with the id of its submission so
+results of earlier submissions are never mistaken for current ones. workers on any host with access to the directory
+claim a job by atomically renaming it into <queue>/claimed, keep its modification time fresh while they run it and
+write the compact RunRecord into <queue>/done, or a JobFailure with the traceback if the run raised. jobs whose claim
+was not refreshed within the timeout (e.g. because the worker crashed) are moved back into pending and picked up by
+another worker, up to max_reassignments times.
+
+start a worker with:
+    python -m src.distributed <queue directory>
+"""
+from multiprocessing import Process
+import os
+import pathlib
+import pickle
+import socket
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+from src.simulation import run_replication
+
+
+STOP_FILE = "STOP"
+
+
+def write_atomic(path, data):
+    temporary = path.with_name(f".{path.name}.{socket.gethostname()}.{os.getpid()}.tmp")
+    with open(temporary, "wb") as file:
+        pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, path)
+
+
+def job_name(submission, scenario, run):
+    return f"{submission}-{scenario:04d}-{run:06d}.pkl"
+
+
+class JobFailure:
+    """
+    result of a job whose run raised, written into done in place of the RunRecord
+    """
+
+    def __init__(self, host, error):
+        self.host = host
+        self.error = error
+
+
+class QueueDirectory:
+
+    def __init__(self, directory):
+        self.root = pathlib.Path(directory)
+        self.pending = self.root / "pending"
+        self.claimed = self.root / "claimed"
+        self.done = self.root / "done"
+        for path in (self.pending, self.claimed, self.done):
+            path.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def stopped(self):
+        return (self.root / STOP_FILE).exists()
+
+
+class Worker:
+    """
+    pulls jobs from the queue directory until the coordinator shuts the queue down
+    """
+
+    def __init__(self, directory, poll_interval=1.0, heartbeat_interval=10.0):
+        self.queue = QueueDirectory(directory)
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+
+    def claim(self):
+        for job in sorted(self.queue.pending.glob("*.pkl")):
+            claimed = self.queue.claimed / job.name
+            try:
+                os.rename(job, claimed)  # atomic, only one worker can win a job
+            except FileNotFoundError:
+                continue  # claimed by another worker
+            os.utime(claimed)
+            return claimed
+        return None
+
+    def heartbeat(self, claimed, finished):
+        while not finished.wait(self.heartbeat_interval):
+            try:
+                os.utime(claimed)
+            except FileNotFoundError:
+                return  # job was reassigned
+
+    def run(self):
+        while not self.queue.stopped:
+            claimed = self.claim()
+            if claimed is None:
+                time.sleep(self.poll_interval)
+                continue
+
+            finished = threading.Event()
+            heartbeat = threading.Thread(target=self.heartbeat, args=(claimed, finished), daemon=True)
+            heartbeat.start()
+            try:
+                with open(claimed, "rb") as file:
+                    job = pickle.load(file)
+                record = run_replication(job["config"], *job["arguments"])
+            except Exception:
+                # the coordinator raises the failure, the worker keeps serving other jobs
+                record = JobFailure(socket.gethostname(), traceback.format_exc())
+            finally:
+                finished.set()
+                heartbeat.join()
+
+            write_atomic(self.queue.done / claimed.name, record)
+            claimed.unlink(missing_ok=True)
+            print(f"{'failed' if isinstance(record, JobFailure) else 'finished'} job {claimed.stem}")
+
+
+class Coordinator:
+    """
+    hands out the runs of one or more Simulations as jobs and collects their results into the simulation logs.
+    claims older than timeout seconds are considered lost and reassigned, a job lost more than max_reassignments times
+    (e.g. because it crashes every worker) fails the submission
+    """
+
+    def __init__(self, directory, timeout=60.0, poll_interval=1.0, max_reassignments=3):
+        self.queue = QueueDirectory(directory)
+        (self.queue.root / STOP_FILE).unlink(missing_ok=True)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.max_reassignments = max_reassignments
+        self.reassignments = dict()
+
+    def submit(self, simulation, runs, scenario=0, submission=None):
+        """
+        queue the given runs of a simulation, returns the names of their jobs. the job files of every submission carry
+        its id, a new one is made up if none is given
+        """
+        submission = submission if submission is not None else uuid.uuid4().hex[:12]
+        names = dict()
+        for run in runs:
+            names[job_name(submission, scenario, run)] = (scenario, run)
+            write_atomic(self.queue.pending / job_name(submission, scenario, run),
+                         {"config": simulation.config, "arguments": simulation.replication_arguments(run)})
+        return names
+
+    def reassign_lost(self, jobs):
+        now = time.time()
+        for name in jobs:
+            claimed = self.queue.claimed / name
+            try:
+                if now - claimed.stat().st_mtime > self.timeout:
+                    self.reassignments[name] = self.reassignments.get(name, 0) + 1
+                    if self.reassignments[name] > self.max_reassignments:
+                        raise RuntimeError(f"job {claimed.stem} was lost {self.max_reassignments + 1} times, giving up")
+                    os.rename(claimed, self.queue.pending / name)
+                    print(f"reassigned job {claimed.stem}")
+            except FileNotFoundError:
+                continue  # not claimed, finished or reassigned in the meantime
+
+    def withdraw(self, jobs):
+        # remove the files of a submission which are left in the queue
+        for name in jobs:
+            for directory in (self.queue.pending, self.queue.claimed, self.queue.done):
+                (directory / name).unlink(missing_ok=True)
+
+    def run(self, simulations):
+        """
+        run the configured number of runs of every simulation on the workers. blocks until all results are in
+        """
+        submission = uuid.uuid4().hex[:12]
+        jobs = dict()
+        for scenario, simulation in enumerate(simulations):
+            jobs.update(self.submit(simulation, range(len(simulation.customerLog), simulation.runs), scenario,
+                                    submission))
+
+        records = dict()
+        try:
+            while len(records) < len(jobs):
+                for name, (scenario, run) in jobs.items():
+                    done = self.queue.done / name
+                    if (scenario, run) not in records and done.exists():
+                        with open(done, "rb") as file:
+                            record = pickle.load(file)
+                        done.unlink()
+                        if isinstance(record, JobFailure):
+                            raise RuntimeError(f"job {done.stem} failed on {record.host}:\n{record.error}")
+                        records[(scenario, run)] = record
+                if len(records) < len(jobs):
+                    self.reassign_lost(jobs)
+                    time.sleep(self.poll_interval)
+        finally:
+            # jobs still pending are dropped, late duplicates of finished ones are not needed
+            self.withdraw(jobs)
+
+        # results are added in run order, independent of which worker finished first
+        for scenario, run in sorted(records.keys()):
+            simulations[scenario].add_record(records[(scenario, run)])
+        return simulations
+
+    def shutdown(self):
+        (self.queue.root / STOP_FILE).touch()
+
+
+def run_worker(directory, poll_interval=1.0, heartbeat_interval=10.0):
+    Worker(directory, poll_interval, heartbeat_interval).run()
+
+
+def start_local_workers(directory, count, poll_interval=1.0, heartbeat_interval=10.0):
+    """
+    start worker processes on this machine, e.g. to test the coordinator on a single box
+    """
+    workers = [Process(target=run_worker, args=(directory, poll_interval, heartbeat_interval)) for _ in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+if __name__ == "__main__":
+    run_worker(sys.argv[1])
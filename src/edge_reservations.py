@@ -0,0 +1,102 @@
+from collections import deque
+
+
+class EdgeReservations:
+    """
+    central scheduler for the narrow edges of the path grid, which can only be used by one customer with a cart at a
+    time. a traversal is granted or queued in a single call and only customers which have to wait get an event.
+    every edge keeps a timeline of its occupied intervals, the blocking statistics are updated along the way
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.edges = []
+
+        self.holder = dict()  # customer currently using an edge
+        self.waiting = dict()  # fifo queue of (customer, event, request time) per edge
+        self.timeline = dict()  # occupied intervals [start, end, ucid] per edge, end is None while in use
+
+        self.traversals = dict()
+        self.blocked = dict()
+        self.wait_time = dict()
+        self.queue_integral = dict()
+        self.queue_changed = dict()
+
+    def add(self, edge):
+        self.edges.append(edge)
+        self.waiting[edge] = deque()
+        self.timeline[edge] = []
+        self.traversals[edge] = 0
+        self.blocked[edge] = 0
+        self.wait_time[edge] = 0.0
+        self.queue_integral[edge] = 0.0
+        self.queue_changed[edge] = 0.0
+
+    def occupied(self, edge):
+        return edge in self.holder
+
+    def load(self, edge):
+        # number of customers using or waiting for an edge
+        return (edge in self.holder) + len(self.waiting[edge])
+
+    def update_queue(self, edge):
+        # integrate the queue length up to now before it changes
+        self.queue_integral[edge] += len(self.waiting[edge]) * (self.env.now - self.queue_changed[edge])
+        self.queue_changed[edge] = self.env.now
+
+    def grant(self, edge, customer):
+        self.holder[edge] = customer
+        self.timeline[edge].append([self.env.now, None, customer.ucid])
+
+    def reserve(self, edge, customer):
+        """
+        reserve an edge for a customer. returns None if the edge was granted right away, otherwise an event which is
+        triggered once it is the customer's turn
+        """
+        self.traversals[edge] += 1
+        if edge not in self.holder:
+            self.grant(edge, customer)
+            return None
+        self.update_queue(edge)
+        event = self.env.event()
+        self.waiting[edge].append((customer, event, self.env.now))
+        self.blocked[edge] += 1
+        return event
+
+    def release(self, edge, customer):
+        """
+        release the edge held by the customer and hand it to the next waiting customer, or withdraw the customer from
+        the queue of the edge if it was still waiting (e.g. because it was interrupted)
+        """
+        if self.holder.get(edge) is not customer:
+            for entry in self.waiting[edge]:
+                if entry[0] is customer:
+                    self.update_queue(edge)
+                    self.waiting[edge].remove(entry)
+                    self.wait_time[edge] += self.env.now - entry[2]
+                    return
+            return
+
+        self.timeline[edge][-1][1] = self.env.now
+        del self.holder[edge]
+        if self.waiting[edge]:
+            self.update_queue(edge)
+            customer, event, since = self.waiting[edge].popleft()
+            self.wait_time[edge] += self.env.now - since
+            self.grant(edge, customer)
+            event.succeed()
+
+    def statistics(self):
+        """
+        blocking statistics per edge (named by its nodes): traversals, blocked traversals, total wait time, occupied
+        time and the queue length integral
+        """
+        statistics = dict()
+        for edge in self.edges:
+            self.update_queue(edge)
+            occupied = sum((end if end is not None else self.env.now) - start
+                           for start, end, _ in self.timeline[edge])
+            statistics[edge.name] = {"traversals": self.traversals[edge], "blocked": self.blocked[edge],
+                                     "wait_time": float(self.wait_time[edge]), "occupied_time": float(occupied),
+                                     "queue_integral": float(self.queue_integral[edge])}
+        return statistics
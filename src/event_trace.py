@@ -0,0 +1,124 @@
+"""
+structured event trace of the customers. events are typed records (time, customer id, event code, department and
+coordinates) collected in a preallocated numpy buffer. without a trace file the buffer is a ring keeping the latest
+events, with a trace file every full buffer is appended to it as a chunk (the file is a .npy stream, a header with the
+department names followed by the event chunks, each written with np.save). echoed events are printed to the console
+as they are recorded, so the console follows the simulation.
+
+decode a trace file with:
+    python -m src.event_trace trace.npy [ucid ...]
+"""
+import sys
+
+import numpy as np
+
+
+TRACE_DTYPE = np.dtype([("time", "f8"), ("ucid", "i8"), ("code", "u1"), ("department", "S1"),
+                        ("x", "f8"), ("y", "f8"), ("u", "f8"), ("v", "f8")])
+
+# event codes. x, y is the position of the customer or the item, u, v hold the code specific values noted below
+ENTER = 1  # enters a department
+WALK = 2  # walks from x, y to the item at u, v
+PICK = 3  # picks up the item at x, y
+PICKED = 4  # picked u items in v seconds at a department
+LEAVE = 5  # leaves a department
+CHECKOUT = 6  # enters the checkout, u is the lane
+SCAN = 7  # items are scanned at the checkout
+PAY = 8  # pays at the checkout
+
+
+class EventTracer:
+    """
+    collects the events of one replication. path is the .npy stream the chunks are appended to, echo prints every
+    event as it is recorded. departments maps the department ids to their names, which are written as the header of
+    the stream
+    """
+
+    def __init__(self, departments, capacity=65536, path=None, echo=False):
+        self.departments = dict(departments)
+        self.buffer = np.zeros(capacity, dtype=TRACE_DTYPE)
+        self.size = 0  # events in the buffer
+        self.recorded = 0  # events recorded in total
+        self.path = path
+        self.echo = echo
+        if self.path is not None:
+            with open(self.path, "wb") as file:
+                np.save(file, np.asarray(list(self.departments.items()), dtype=str).reshape(-1, 2))
+
+    def record(self, time, ucid, code, department=b"", x=0.0, y=0.0, u=0.0, v=0.0):
+        if self.size == len(self.buffer):
+            if self.path is None:
+                self.size = 0  # ring, overwrite the oldest events
+            else:
+                self.flush()
+        self.buffer[self.size] = (time, ucid, code, department, x, y, u, v)
+        if self.echo:
+            for line in render(self.buffer[self.size:self.size + 1], self.departments):
+                print(line, flush=True)
+        self.size += 1
+        self.recorded += 1
+
+    def events(self):
+        # buffered events in the order they were recorded
+        if self.recorded > len(self.buffer) and self.path is None:
+            return np.concatenate((self.buffer[self.size:], self.buffer[:self.size]))
+        return self.buffer[:self.size].copy()
+
+    def flush(self):
+        with open(self.path, "ab") as file:
+            np.save(file, self.buffer[:self.size])
+        self.size = 0
+
+    def close(self):
+        # append the remaining events to the trace file, the ring keeps them
+        if self.path is not None:
+            self.flush()
+
+
+def read_trace(path):
+    """
+    read a trace stream, returns the department names and all events
+    """
+    chunks = []
+    with open(path, "rb") as file:
+        departments = dict(np.load(file))
+        while file.peek(1):
+            chunks.append(np.load(file))
+    return departments, np.concatenate(chunks) if chunks else np.zeros(0, dtype=TRACE_DTYPE)
+
+
+def render(events, departments=None, ucids=None):
+    """
+    human readable log lines of the events, optionally only the ones of the given customers
+    """
+    if ucids is not None:
+        events = events[np.isin(events["ucid"], list(ucids))]
+    departments = departments or dict()
+    for event in events:
+        time, ucid, code, department = event["time"], event["ucid"], event["code"], event["department"].decode()
+        x, y, u, v = event["x"], event["y"], event["u"], event["v"]
+        if code == ENTER:
+            yield '{:.2f}: {} enters department {}'.format(time, ucid, departments.get(department, department))
+        elif code == WALK:
+            yield '{:.2f}: {} walking from ({:.2f},{:.2f}) to ({:.2f},{:.2f})'.format(time, ucid, x, y, u, v)
+        elif code == PICK:
+            yield '{:.2f}: {} picks up item at ({:.2f},{:.2f})'.format(time, ucid, x, y)
+        elif code == PICKED:
+            yield '{:.2f}: {} picked {} items at department {} in {:.2f} seconds'.format(time, ucid, int(u),
+                                                                                         department, v)
+        elif code == LEAVE:
+            yield '{:.2f}: {} leaves department {}'.format(time, ucid, department)
+        elif code == CHECKOUT:
+            yield '{:.2f}: {} enters checkout'.format(time, ucid)
+        elif code == SCAN:
+            yield '{:.2f}: {} scans items at checkout'.format(time, ucid)
+        elif code == PAY:
+            yield '{:.2f}: {} pays at checkout'.format(time, ucid)
+        else:
+            yield '{:.2f}: {} unknown event {}'.format(time, ucid, code)
+
+
+if __name__ == "__main__":
+    departments, events = read_trace(sys.argv[1])
+    for line in render(events, departments, [int(ucid) for ucid in sys.argv[2:]] or None):
+        print(line)
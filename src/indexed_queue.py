@@ -0,0 +1,126 @@
+_END = object()
+
+
+class IndexedQueue:
+    """
+    fifo queue with a linked order and a position map. appending, removing any item, popping the head and finding the
+    items ahead and behind are O(1), the position of an item is O(log n) from a fenwick tree over the order in which
+    the items were appended. supports the list operations simpy uses on the put queue of a resource, so it can be used
+    as PutQueue. items have to be hashable and unique
+    """
+
+    def __init__(self):
+        self.head = _END
+        self.tail = _END
+        self.ahead_of = dict()
+        self.behind_of = dict()
+        self.order = dict()  # number of every item in the order of appending
+        self.appended = 0
+        self.tree = [0] * 65  # fenwick tree counting the items still queued per order number, 1-based
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, item):
+        return item in self.order
+
+    def __iter__(self):
+        item = self.head
+        while item is not _END:
+            yield item
+            item = self.behind_of[item]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("queue index out of range")
+        if index == len(self) - 1:
+            return self.tail
+        for k, item in enumerate(self):
+            if k == index:
+                return item
+
+    def append(self, item):
+        if self.appended + 1 >= len(self.tree):
+            if 2 * self.order[self.head] >= len(self.tree) - 1:
+                self.compact()  # at least half of the numbers belong to items which left the queue
+            else:
+                self.grow()
+        self.order[item] = self.appended
+        self.update(self.appended, 1)
+        self.appended += 1
+
+        self.ahead_of[item] = self.tail
+        self.behind_of[item] = _END
+        if self.tail is _END:
+            self.head = item
+        else:
+            self.behind_of[self.tail] = item
+        self.tail = item
+
+    def remove(self, item):
+        if item not in self.order:
+            raise ValueError("item is not in the queue")
+        self.update(self.order.pop(item), -1)
+
+        ahead = self.ahead_of.pop(item)
+        behind = self.behind_of.pop(item)
+        if ahead is _END:
+            self.head = behind
+        else:
+            self.behind_of[ahead] = behind
+        if behind is _END:
+            self.tail = ahead
+        else:
+            self.ahead_of[behind] = ahead
+        if not self.order:
+            # the tree is all zeros again, numbering can start over. a queue which never empties is renumbered by
+            # compact once the numbers run out
+            self.appended = 0
+
+    def pop(self, index=-1):
+        item = self[index]
+        self.remove(item)
+        return item
+
+    def index(self, item):
+        # position of the item, the number of queued items appended before it
+        if item not in self.order:
+            raise ValueError("item is not in the queue")
+        position = 0
+        i = self.order[item]
+        while i > 0:
+            position += self.tree[i]
+            i -= i & -i
+        return position
+
+    def ahead(self, item):
+        # item directly ahead in the queue, None for the head
+        ahead = self.ahead_of[item]
+        return None if ahead is _END else ahead
+
+    def behind(self, item):
+        # item directly behind in the queue, None for the tail
+        behind = self.behind_of[item]
+        return None if behind is _END else behind
+
+    def update(self, number, delta):
+        i = number + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def compact(self):
+        # number the queued items from 0 in queue order and rebuild the fenwick tree, the head offset is gone
+        self.tree = [0] * len(self.tree)
+        for number, item in enumerate(self):
+            self.order[item] = number
+            self.update(number, 1)
+        self.appended = len(self.order)
+
+    def grow(self):
+        # double the size of the fenwick tree and rebuild it from the queued items
+        self.tree = [0] * (2 * len(self.tree) - 1)
+        for number in self.order.values():
+            self.update(number, 1)
@@ -0,0 +1,174 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+
+from src.simulation import Simulation
+from src.sweep import apply_overrides, override_grid, run_scenario_jobs
+
+
+class Constraint:
+    """
+    service constraint on a resource configuration: the expected value of a KPI (see PrecisionTarget) must not exceed
+    limit. tolerance is the indifference zone, configurations within tolerance of the limit may be classified either
+    way
+    """
+
+    def __init__(self, kpi, key=None, limit=0.0, tolerance=1.0):
+        self.kpi = kpi
+        self.key = key
+        self.limit = limit
+        self.tolerance = tolerance
+
+    @property
+    def label(self):
+        if self.key is None:
+            return self.kpi
+        return f"{self.kpi}({self.key})"
+
+
+class ResourceOptimizer:
+    """
+    finds the cheapest configuration of the resource quantities which satisfies all constraints.
+    every candidate and constraint is checked with the fully sequential feasibility check of Andradottir & Kim
+    (procedure F) on top of a first stage of initial_replications runs. candidates are eliminated as soon as one
+    constraint is shown to be violated, and all candidates more expensive than a configuration shown to be feasible are
+    dropped as dominated. the remaining replications are spent on the contenders in proportion to how ambiguous their
+    constraints still are (OCBA-style allocation). with all errors split over the candidate/constraint pairs
+    (Bonferroni), the selected configuration is the cheapest feasible one with probability at least pcs, under normally
+    distributed replication means and outside the indifference zones
+    """
+
+    def __init__(self, config, candidates, costs, constraints, pcs=0.95, initial_replications=10, batch_size=None,
+                 max_replications=100, workers=None, seed=0, cache=None):
+        self.config = config
+        if isinstance(candidates, dict):
+            candidates = override_grid(candidates)
+        else:
+            candidates = [{"resource quantities": c} for c in candidates]
+        self.costs = costs
+        self.constraints = constraints
+        self.pcs = pcs
+        if initial_replications < 2:
+            raise ValueError(f"the first stage needs at least 2 replications to estimate variances, got "
+                             f"{initial_replications}")
+        self.initial_replications = initial_replications
+        self.max_replications = max_replications
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.batch_size = batch_size if batch_size is not None else 2 * self.workers
+
+        # candidates are considered from cheap to expensive
+        self.candidates = sorted(candidates, key=self.cost)
+        self.simulations = [Simulation(apply_overrides(config, c), runs=0, seed=seed, common_random_numbers=True,
+                                       cache=cache)
+                            for c in self.candidates]
+
+        # constants of the sequential feasibility check, the error is split over all candidate/constraint pairs
+        beta = (1 - pcs) / (len(self.candidates) * len(self.constraints))
+        eta = 0.5 * ((2 * beta) ** (-2 / (initial_replications - 1)) - 1)
+        self.h2 = 2 * eta * (initial_replications - 1)
+
+        # None while undecided, True if the constraint is satisfied, False if it is violated
+        self.decisions = [[None] * len(self.constraints) for _ in self.candidates]
+        self.variances = [None] * len(self.candidates)
+
+    def cost(self, candidate):
+        quantities = candidate["resource quantities"]
+        return sum(self.costs[key] * value for key, value in quantities.items())
+
+    def constraint_values(self, c):
+        # replication means of every constraint KPI, runs in which a resource was not used count as zero
+        return np.asarray([np.nan_to_num(self.simulations[c].replication_values(constraint.kpi, constraint.key))
+                           for constraint in self.constraints])
+
+    def update_decisions(self, c):
+        values = self.constraint_values(c)
+        if self.variances[c] is None:
+            # the variance is estimated from the first stage only
+            self.variances[c] = values[:, :self.initial_replications].var(axis=1, ddof=1)
+        runs = values.shape[1]
+        for l, constraint in enumerate(self.constraints):
+            if self.decisions[c][l] is not None:
+                continue
+            deviation = np.sum(values[l] - constraint.limit)
+            bound = max(0.0, self.h2 * self.variances[c][l] / (2 * constraint.tolerance) -
+                        constraint.tolerance * runs / 2)
+            if deviation <= -bound:
+                self.decisions[c][l] = True
+            elif deviation >= bound:
+                self.decisions[c][l] = False
+
+    def ambiguity(self, c):
+        # squared ratio of noise to distance from the limit of the least decided constraint
+        values = self.constraint_values(c)
+        weights = [self.variances[c][l] / max(abs(values[l].mean() - constraint.limit), constraint.tolerance) ** 2
+                   for l, constraint in enumerate(self.constraints) if self.decisions[c][l] is None]
+        return max(weights + [1e-12])
+
+    def allocate(self, contenders):
+        # spread a batch over the contenders proportional to their ambiguity, every contender gets at least one run
+        weights = np.asarray([self.ambiguity(c) for c in contenders])
+        shares = np.maximum(1, np.floor(self.batch_size * weights / weights.sum())).astype(int)
+        return {c: min(int(n), self.max_replications - self.simulations[c].runs) for c, n in zip(contenders, shares)}
+
+    def run(self):
+        active = list(range(len(self.candidates)))
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            allocation = {c: self.initial_replications for c in active}
+            while True:
+                run_scenario_jobs(pool, self.simulations,
+                                  [(c, self.simulations[c].runs + k) for c, n in allocation.items() for k in range(n)])
+                for c in active:
+                    self.update_decisions(c)
+
+                # eliminate infeasible and dominated candidates
+                active = [c for c in active if False not in self.decisions[c]]
+                feasible = [c for c in active if all(self.decisions[c])]
+                if feasible:
+                    cheapest = min(self.cost(self.candidates[c]) for c in feasible)
+                    active = [c for c in active if self.cost(self.candidates[c]) <= cheapest]
+
+                contenders = [c for c in active if None in self.decisions[c] and
+                              self.simulations[c].runs < self.max_replications]
+                if not contenders:
+                    break
+                allocation = self.allocate(contenders)
+
+        return self.report(active)
+
+    def report(self, active):
+        feasible = [c for c in active if all(self.decisions[c])]
+        guaranteed = len(feasible) > 0 and all(None not in self.decisions[c] for c in active)
+        if feasible:
+            # cheapest feasible configuration, equally expensive ones are ranked by their worst relative KPI
+            selected = min(feasible, key=lambda c: (self.cost(self.candidates[c]),
+                                                    max(v.mean() / max(abs(k.limit), 1e-12) for v, k in
+                                                        zip(self.constraint_values(c), self.constraints))))
+        elif active:
+            # budget exhausted before any configuration was shown to be feasible
+            selected = active[0]
+        else:
+            selected = None
+
+        print('---------------------------------')
+        print("simulated {} runs over {} candidates".format(sum(s.runs for s in self.simulations),
+                                                            len(self.candidates)))
+        if selected is None:
+            print("no candidate satisfies the constraints")
+            print('---------------------------------')
+            return {"selected": None, "cost": None, "guaranteed": False, "pcs": self.pcs, "estimates": {},
+                    "runs": [s.runs for s in self.simulations]}
+
+        estimates = dict()
+        for constraint, values in zip(self.constraints, self.constraint_values(selected)):
+            estimates[constraint.label] = values.mean()
+        print("selected {} at cost {:.2f} ({})".format(self.candidates[selected]["resource quantities"],
+                                                       self.cost(self.candidates[selected]),
+                                                       f"P(correct selection) >= {self.pcs}" if guaranteed else
+                                                       "budget exhausted, no guarantee"))
+        for label, mean in estimates.items():
+            print("{}: {:.4f}".format(label, mean))
+        print('---------------------------------')
+        return {"selected": self.candidates[selected]["resource quantities"], "cost": self.cost(self.candidates[selected]),
+                "guaranteed": guaranteed, "pcs": self.pcs, "estimates": estimates,
+                "runs": [s.runs for s in self.simulations]}
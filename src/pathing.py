@@ -1,7 +1,13 @@
 import numpy as np
 import heapq
+import math
 
-from src.TracedResource import TracedResource
+from src.edge_reservations import EdgeReservations
+
+
+# routing tables per compiled layout, shared by all path grids with the same layout (e.g. the stores of all replications
+# in a process)
+_routing_tables = dict()
 
 
 class PathGrid:
@@ -11,13 +17,26 @@ class PathGrid:
         self.nodes = []
         self.edges = []
         self.sorted_edges = dict()
-        self.matrix = np.zeros((0, 0))
+        # narrow edges can only be used by one customer with a cart at a time
+        self.reservations = EdgeReservations(env)
+        # compiled adjacency of the directed graph in compressed sparse row form, built by scale
+        self.indptr = [0]
+        self.indices = []
+        self.weights = []
+        self.compiled_edges = []
+        # all-pairs shortest path lengths and the next node on the shortest path, distances[i][j] and next_hops[i][j]
+        self.distances = []
+        self.next_hops = []
+        # spatial index over the edges of every department (and all edges under None), built by scale
+        self.edge_index = dict()
 
     def add_node(self, pos):
         self.nodes.append(PathNode(pos, len(self.nodes)))
 
     def add_edge(self, nodeid_0, nodeid_1, bidirectional=True, departments=None, narrow=False):
         self.edges.append(PathEdge(self.env, self.nodes[nodeid_0], self.nodes[nodeid_1], bidirectional, narrow))
+        if narrow:
+            self.reservations.add(self.edges[-1])
         if departments is not None:
             for dep in departments:
                 if dep not in self.sorted_edges:
@@ -30,87 +49,325 @@ class PathGrid:
             node.scale(old, new)
         for edge in self.edges:
             edge.scale()
-        self.matrix = np.zeros((len(self.nodes), len(self.nodes)))
+        self.build()
+
+    def build(self):
+        # compiled graph, routing tables and closest edge indexes, to be rebuilt when nodes or edges are added later
+        self.compile()
+        self.edge_index = {dep: EdgeIndex(edges) for dep, edges in self.sorted_edges.items()}
+        self.edge_index[None] = EdgeIndex(self.edges)
+
+    def compile(self):
+        """
+        compile the edges into compressed sparse row form. the neighbours of node i are indices[indptr[i]:indptr[i + 1]]
+        in ascending order with the edge lengths in weights and the edges in compiled_edges. plain lists are used as
+        they are faster to iterate than arrays for the scalar search loop
+        """
+        adjacency = [dict() for _ in self.nodes]
         for edge in self.edges:
-            self.matrix[edge.start.unid, edge.end.unid] = edge.length
+            adjacency[edge.start.unid][edge.end.unid] = edge
             if edge.bidirectional:
-                self.matrix[edge.end.unid, edge.start.unid] = edge.length
+                adjacency[edge.end.unid][edge.start.unid] = edge
+        self.indptr = [0]
+        self.indices = []
+        self.weights = []
+        self.compiled_edges = []
+        for neighbours in adjacency:
+            for node_id in sorted(neighbours):
+                if neighbours[node_id].length != 0.0:
+                    self.indices.append(node_id)
+                    self.weights.append(float(neighbours[node_id].length))
+                    self.compiled_edges.append(neighbours[node_id])
+            self.indptr.append(len(self.indices))
+
+        layout = (tuple(self.indptr), tuple(self.indices), tuple(self.weights))
+        if layout not in _routing_tables:
+            _routing_tables[layout] = self.routing_tables()
+        self.distances, self.next_hops = _routing_tables[layout]
+
+    def routing_tables(self):
+        """
+        all-pairs shortest path lengths and next hops, from one dijkstra search per target over the reversed graph.
+        walking the next hops towards a target stays in the shortest path tree of that target
+        """
+        incoming = [[] for _ in self.nodes]
+        for node_id in range(len(self.nodes)):
+            for k in range(self.indptr[node_id], self.indptr[node_id + 1]):
+                incoming[self.indices[k]].append((node_id, self.weights[k]))
+
+        distances = np.full((len(self.nodes), len(self.nodes)), np.inf)
+        next_hops = np.full((len(self.nodes), len(self.nodes)), -1, dtype=np.int64)
+        for target in range(len(self.nodes)):
+            dist = distances[:, target]
+            dist[target] = 0.0
+            next_hops[target, target] = target
+            open_list = [(0.0, target)]
+            while open_list:
+                current_dist, current = heapq.heappop(open_list)
+                if current_dist > dist[current]:
+                    continue
+                for node_id, length in incoming[current]:
+                    if current_dist + length < dist[node_id]:
+                        dist[node_id] = current_dist + length
+                        next_hops[node_id, target] = current
+                        heapq.heappush(open_list, (current_dist + length, node_id))
+        # nested lists, single lookups in them are much cheaper than in arrays
+        return distances.tolist(), next_hops.tolist()
+
+    def endpoint(self, point, dep):
+        # closest edge (None for nodes) and links to the graph of a node index, position or Location
+        if isinstance(point, int):
+            return None, [(point, 0.0)]
+        if isinstance(point, Location):
+            return point.edge, point.links
+        edge = self.get_closest_edge(point, dep)
+        return edge, self.attach(edge, point)
+
+    def locate(self, point, dep):
+        edge = self.get_closest_edge(point, dep)
+        return Location(point, edge, self.attach(edge, point))
+
+    def locate_many(self, points, dep):
+        return [Location(point, edge, self.attach(edge, point))
+                for point, edge in zip(points, self.get_closest_edges(points, dep))]
+
+    def route(self, start, goal, dep_0, dep_1):
+        """
+        shortest path between two nodes, positions or Locations from the routing tables, in the same form as returned
+        by dijkstra. positions are attached to the nodes of their closest edge in the given department, the best
+        combination of attachment nodes is looked up and the path is reconstructed by following the next hops
+        """
+        start_edge, start_links = self.endpoint(start, dep_0)
+        goal_edge, goal_links = self.endpoint(goal, dep_1)
+        if start_edge is not None and start_edge == goal_edge:
+            return [None]
+
+        best = np.inf
+        for first, start_length in start_links:
+            distances = self.distances[first]
+            for last, goal_length in goal_links:
+                if start_length + distances[last] + goal_length < best:
+                    best = start_length + distances[last] + goal_length
+                    best_first, best_last = first, last
+        if best == np.inf:
+            return None
+
+        node_id = best_first
+        path = [] if start_edge is None else [node_id]
+        next_hops = self.next_hops
+        while node_id != best_last:
+            node_id = next_hops[node_id][best_last]
+            path.append(node_id)
+        if goal_edge is not None:
+            path.append(len(self.nodes) + 1)  # virtual goal node
+        return path
 
     def dijkstra(self, start, goal, dep_0, dep_1):
         """
          Dijkstra algorithm for pathfinding on a graph. returns a list of node indices along which to travel for
          shortest path
         """
-        matrix = np.zeros((len(self.nodes) + 2, len(self.nodes) + 2))
-        matrix[:-2, :-2] = self.matrix
-
+        # positions off the graph are attached to both nodes of their closest edge through a virtual start node
+        # (len(nodes)) or goal node (len(nodes) + 1), the compiled graph itself is never copied
+        start_links = ()
+        goal_links = dict()
         if not isinstance(start, int) and not isinstance(goal, int):
             start_edge = self.get_closest_edge(start, dep_0)
             goal_edge = self.get_closest_edge(goal, dep_1)
             if start_edge == goal_edge:
                 return [None]
-
-            matrix[-2, start_edge.end.unid] = np.linalg.norm(start_edge.end.pos - start)
-            matrix[-2, start_edge.start.unid] = np.linalg.norm(start_edge.start.pos - start)
-            start_id = len(matrix) - 2
-
-            matrix[goal_edge.start.unid, -1] = np.linalg.norm(goal_edge.start.pos - goal)
-            matrix[goal_edge.end.unid, -1] = np.linalg.norm(goal_edge.end.pos - goal)
-            goal_id = len(matrix) - 1
+            start_links = self.attach(start_edge, start)
+            goal_links = dict(self.attach(goal_edge, goal))
+            start_id = len(self.nodes)
+            goal_id = len(self.nodes) + 1
         elif not isinstance(start, int):
-            edge = self.get_closest_edge(start, dep_0)
-            matrix[-2, edge.end.unid] = np.linalg.norm(edge.end.pos - start)
-            matrix[-2, edge.start.unid] = np.linalg.norm(edge.start.pos - start)
-            start_id = len(matrix) - 2
+            start_links = self.attach(self.get_closest_edge(start, dep_0), start)
+            start_id = len(self.nodes)
             goal_id = goal
         elif not isinstance(goal, int):
-            edge = self.get_closest_edge(goal, dep_1)
-            matrix[edge.start.unid, -1] = np.linalg.norm(edge.start.pos - goal)
-            matrix[edge.end.unid, -1] = np.linalg.norm(edge.end.pos - goal)
-            goal_id = len(matrix) - 1
+            goal_links = dict(self.attach(self.get_closest_edge(goal, dep_1), goal))
+            goal_id = len(self.nodes) + 1
             start_id = start
         else:
             start_id = start
             goal_id = goal
 
-        nodes = []
-        for node in range(len(matrix)):
-            nodes.append(DijkstraNode(node))
-
-        nodes[start_id].dist = 0.0
-        open_list = []
-        heapq.heappush(open_list, nodes[start_id])
-        while len(open_list) > 0:
-            current_node = heapq.heappop(open_list)
-            if current_node.unid == goal_id:
-                return current_node.path()#[:-1]
-            for node_id, dist in enumerate(matrix[current_node.unid]):
-                if dist == 0.0:
-                    continue
-                if nodes[node_id].dist > current_node.dist + dist:
-                    nodes[node_id].dist = current_node.dist + dist
-                    nodes[node_id].prev = current_node
-                    heapq.heappush(open_list, nodes[node_id])
-
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        dist = {start_id: 0.0}
+        prev = dict()
+        open_list = [(0.0, start_id)]
+        while open_list:
+            current_dist, current = heapq.heappop(open_list)
+            if current == goal_id:
+                path = []
+                while current != start_id:
+                    path.append(current)
+                    current = prev[current]
+                return path[::-1]
+            if current_dist > dist[current]:
+                continue  # outdated entry, the node was reached on a shorter path already
+
+            if current == start_id and start_links:
+                links = start_links
+            else:
+                links = zip(indices[indptr[current]:indptr[current + 1]], weights[indptr[current]:indptr[current + 1]])
+            for node_id, length in links:
+                if current_dist + length < dist.get(node_id, np.inf):
+                    dist[node_id] = current_dist + length
+                    prev[node_id] = current
+                    heapq.heappush(open_list, (current_dist + length, node_id))
+            if current in goal_links:
+                length = goal_links[current]
+                if current_dist + length < dist.get(goal_id, np.inf):
+                    dist[goal_id] = current_dist + length
+                    prev[goal_id] = current
+                    heapq.heappush(open_list, (current_dist + length, goal_id))
+
+    def congested_path(self, start, goal):
+        """
+        A* search between two nodes on the current congestion of the narrow edges. a narrow edge counts as long as
+        itself once for every customer using or waiting for it in addition to its own length. the static shortest
+        distance to the goal from the routing tables is the heuristic, it dominates the euclidean distance and is still
+        admissible as congestion only makes edges longer, so without congestion only the nodes on the shortest path are
+        expanded. returns the path like dijkstra or None if the goal can not be reached
+        """
+        indptr, indices, weights, edges = self.indptr, self.indices, self.weights, self.compiled_edges
+        distances = self.distances
+        dist = {start: 0.0}
+        prev = dict()
+        closed = set()
+        open_list = [(distances[start][goal], start)]
+        while open_list:
+            _, current = heapq.heappop(open_list)
+            if current == goal:
+                path = []
+                while current != start:
+                    path.append(current)
+                    current = prev[current]
+                return path[::-1]
+            if current in closed:
+                continue
+            closed.add(current)
+            for k in range(indptr[current], indptr[current + 1]):
+                node_id = indices[k]
+                length = weights[k]
+                if edges[k].narrow:
+                    length *= 1 + self.reservations.load(edges[k])
+                if dist[current] + length < dist.get(node_id, np.inf):
+                    dist[node_id] = dist[current] + length
+                    prev[node_id] = current
+                    heapq.heappush(open_list, (dist[node_id] + distances[node_id][goal], node_id))
+        return None
+
+    def attach(self, edge, point):
+        # links between a point on an edge and the nodes of that edge in ascending node order, zero lengths are no links
+        links = sorted([(edge.start.unid, np.linalg.norm(edge.start.pos - point)),
+                        (edge.end.unid, np.linalg.norm(edge.end.pos - point))])
+        return [(node_id, length) for node_id, length in links if length != 0.0]
 
     def get_closest_edge(self, point, dep):
         # find physically closest edge to a given point
-        if dep is None:
-            edges = self.edges
-        else:
-            edges = self.sorted_edges[dep]
-        dist = np.zeros(len(edges), np.float64) # technically dist^2 for calculation efficiency
-        proj = np.zeros(len(edges), np.float64)
-        for e, edge in enumerate(edges):
-            proj[e] = np.dot(point - edge.start.pos, edge.vec) / edge.length
-            if proj[e] < 0.0 or proj[e] > edge.length:
-                # anchorpoint for normal between point and edge lies outside of edge change calculation to distance from
-                # start or end point whichever is shorter
-                dist[e] = min(np.sum(np.square(point - edge.start.pos)), np.sum(np.square(point - edge.end.pos)))
-                continue
-            dist[e] = np.sum(np.square(np.cross(point - edge.start.pos, edge.vec))) / edge.length ** 2
+        return self.edge_index[dep].closest(point)
+
+    def get_closest_edges(self, points, dep):
+        # closest edge of each of the given points
+        return self.edge_index[dep].closest_many(points)
+
+
+class EdgeIndex:
+    """
+    uniform grid over a set of edges for closest edge queries. every cell holds the edges which can be the closest edge
+    of a point in the cell: the distance to a segment changes at most as much as the point moves, so only edges within
+    the smallest distance from the cell center plus the cell diagonal qualify. candidates keep the order of the edges so
+    ties resolve like a search over all edges
+    """
+
+    def __init__(self, edges, cell_size=1.0):
+        self.edges = edges
+        self.cell_size = cell_size
+        self.starts = np.asarray([edge.start.pos for edge in edges], dtype=np.float64)
+        self.ends = np.asarray([edge.end.pos for edge in edges], dtype=np.float64)
+        self.vecs = np.asarray([edge.vec for edge in edges], dtype=np.float64)
+        self.lengths = np.asarray([edge.length for edge in edges], dtype=np.float64)
+
+        self.origin = np.minimum(self.starts.min(axis=0), self.ends.min(axis=0))
+        self.shape = np.maximum(np.ceil((np.maximum(self.starts.max(axis=0), self.ends.max(axis=0)) - self.origin) /
+                                        cell_size).astype(int), 1)
+
+        x, y = np.meshgrid(np.arange(self.shape[0]), np.arange(self.shape[1]), indexing="ij")
+        centers = self.origin + (np.stack([x.ravel(), y.ravel()], axis=1) + 0.5) * cell_size
+        distances = np.sqrt(self.distances(centers))
+        limits = distances.min(axis=1, keepdims=True) + np.sqrt(2.0) * cell_size + 1e-9
+
+        # candidate edges of every cell, cells with the same candidates share their list
+        shared = dict()
+        self.cells = []
+        for row in distances <= limits:
+            candidates = tuple(np.flatnonzero(row))
+            if candidates not in shared:
+                shared[candidates] = [(self.edges[i], self.edges[i].start.pos, self.edges[i].end.pos,
+                                       self.edges[i].vec, self.edges[i].length) for i in candidates]
+            self.cells.append(shared[candidates])
+        self.all_candidates = [(edge, edge.start.pos, edge.end.pos, edge.vec, edge.length) for edge in edges]
+
+    def distances(self, points):
+        """
+        squared distance of every point (rows) to every edge (columns), computed the same way as the single point query
+        so that ties and rounding resolve identically
+        """
+        starts, ends, vecs, lengths = self.starts, self.ends, self.vecs, self.lengths
+        offsets = points[:, None, :] - starts[None, :, :]
+        proj = np.matmul(offsets[:, :, None, :], vecs[None, :, :, None])[:, :, 0, 0] / lengths
+        perpendicular = np.square(offsets[:, :, 0] * vecs[:, 1] - offsets[:, :, 1] * vecs[:, 0]) / lengths ** 2
+        # anchorpoint for normal between point and edge lies outside of edge use the distance from start or end point
+        endpoints = np.minimum(np.sum(np.square(offsets), axis=2),
+                               np.sum(np.square(points[:, None, :] - ends[None, :, :]), axis=2))
+        return np.where((proj < 0.0) | (proj > lengths), endpoints, perpendicular)
+
+    def candidates(self, point):
+        x = math.floor((point[0] - self.origin[0]) / self.cell_size)
+        y = math.floor((point[1] - self.origin[1]) / self.cell_size)
+        if x < 0 or y < 0 or x >= self.shape[0] or y >= self.shape[1]:
+            return self.all_candidates  # outside of the grid all edges are candidates
+        return self.cells[x * self.shape[1] + y]
+
+    def closest(self, point):
+        # only a handful of candidates per cell, a scalar loop is cheaper than array operations here
+        closest = None
+        closest_dist = np.inf
+        for edge, start, end, vec, length in self.candidates(point):
+            offset = point - start
+            proj = np.dot(offset, vec) / length
+            if proj < 0.0 or proj > length:
+                # anchorpoint for normal between point and edge lies outside of edge change calculation to distance
+                # from start or end point whichever is shorter
+                end_offset = point - end
+                dist = min(offset[0] * offset[0] + offset[1] * offset[1],
+                           end_offset[0] * end_offset[0] + end_offset[1] * end_offset[1])
+            else:
+                cross = offset[0] * vec[1] - offset[1] * vec[0]
+                dist = cross * cross / length ** 2
+            if dist < closest_dist:
+                closest = edge
+                closest_dist = dist
+        return closest
+
+    def closest_many(self, points):
+        # vectorized over all points and edges at once
+        return [self.edges[i] for i in np.argmin(self.distances(np.asarray(points)), axis=1)]
+
+
+class Location:
+    """
+    position off the path graph together with its closest edge and the links from the nodes of that edge, so routing to
+    or from it does not have to project it onto the graph again
+    """
+
+    def __init__(self, pos, edge, links):
+        self.pos = pos
+        self.edge = edge
+        self.links = links
 
-        return edges[np.argmin(dist)]
 
 class PathNode(object):
 
@@ -132,10 +389,8 @@ class PathEdge:
         self.start = start
         self.end = end
         self.bidirectional = bidirectional
-        if narrow:
-            self.blockage = TracedResource(env, 1, f"{start.unid}-{end.unid}")
-        else:
-            self.blockage = None
+        self.narrow = narrow
+        self.name = f"{start.unid}-{end.unid}"
 
         self.vec = self.end.pos - self.start.pos
         self.length = np.linalg.norm(self.vec)
@@ -151,21 +406,3 @@ class PathEdge:
         self.vec = self.end.pos - self.start.pos
         self.length = np.linalg.norm(self.vec)
         self.direction = self.vec / self.length
-
-
-class DijkstraNode:
-
-    def __init__(self, unid):
-        self.unid = unid
-        self.dist = np.inf
-        self.prev = None
-
-    def path(self):
-        if self.prev is not None:
-            return self.prev.path() + [self.unid]
-        return []
-
-    def __lt__(self, other):
-        if self.dist == other.dist:
-            return self.unid < other.unid
-        return self.dist < other.dist
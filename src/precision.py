@@ -0,0 +1,53 @@
+from scipy.stats import t as student_t
+import numpy as np
+
+
+def confidence_interval(samples, confidence=0.95):
+    """
+    student-t confidence interval of the mean of independent samples (e.g. replication means)
+    returns the mean and the half width of the interval
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    samples = samples[~np.isnan(samples)]
+    if len(samples) < 2:
+        return (samples.mean() if len(samples) > 0 else np.nan), np.inf
+    half_width = student_t.ppf(0.5 + confidence / 2, len(samples) - 1) * samples.std(ddof=1) / np.sqrt(len(samples))
+    return samples.mean(), half_width
+
+
+class PrecisionTarget:
+    """
+    precision requirement for a single KPI of the simulation. the kpi is the name of a Simulation accessor
+    ("store_times", "wait_times", "use_times", "total_times" or "average_queue_length") or "stockout_fraction", with
+    its key if it takes one.
+    a target is met once the confidence interval half width is below half_width and below relative_error times the
+    mean. criteria which are None are ignored
+    """
+
+    def __init__(self, kpi, key=None, half_width=None, relative_error=None, confidence=0.95):
+        if half_width is None and relative_error is None:
+            raise ValueError("a precision target needs a half_width and/or a relative_error")
+        self.kpi = kpi
+        self.key = key
+        self.half_width = half_width
+        self.relative_error = relative_error
+        self.confidence = confidence
+
+    @property
+    def label(self):
+        if self.key is None:
+            return self.kpi
+        return f"{self.kpi}({self.key})"
+
+    def estimate(self, values):
+        return confidence_interval(values, self.confidence)
+
+    def is_met(self, values):
+        mean, half_width = self.estimate(values)
+        if not np.isfinite(half_width):
+            return False
+        if self.half_width is not None and half_width > self.half_width:
+            return False
+        if self.relative_error is not None and half_width > self.relative_error * abs(mean):
+            return False
+        return True
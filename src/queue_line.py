@@ -0,0 +1,60 @@
+import numpy as np
+
+
+class QueueLine:
+    """
+    geometric layout of the line of customers waiting for a resource. the line runs along the lane, the path from the
+    store entrance to the resource node backwards, slot k is k times the spacing (the customer size) along the lane.
+    customers walk to their slot when they join, everybody standing in line moves up at once when the head of the line
+    is served (triggered by the release event of the resource). moving up needs no events of its own, the positions
+    are evaluated lazily
+    """
+
+    def __init__(self, resource, path_grid, spacing, entrance=0):
+        self.resource = resource
+        self.spacing = spacing
+
+        path = path_grid.route(entrance, resource.node.unid, None, None)
+        if path is None:
+            raise ValueError(f"no path from the entrance to node {resource.node.unid} for the line of {resource.name}")
+        path = path[::-1]
+        points = np.asarray([path_grid.nodes[node].pos for node in path])
+        lengths = np.linalg.norm(np.diff(points, axis=0), axis=1)
+        if lengths.sum() == 0.0:
+            raise ValueError(f"the line of {resource.name} has no room, its node is the entrance")
+        points = np.concatenate((points[:1], points[1:][lengths > 0.0]))
+        lengths = lengths[lengths > 0.0]
+        self.points = points
+        self.arc = np.concatenate(([0.0], np.cumsum(lengths)))  # arc length of the lane at every point
+        self.directions = np.diff(points, axis=0) / lengths[:, None]
+
+        self.standing = dict()  # waiting customers which arrived at their slot, in order of arrival
+        resource.line = self
+
+    def slots(self, indices):
+        # positions of the given slots, the lane is extended along its last segment for very long lines
+        distance = np.asarray(indices) * self.spacing
+        segment = np.minimum(np.searchsorted(self.arc, distance, side="right") - 1, len(self.directions) - 1)
+        return self.points[segment] + (distance - self.arc[segment])[:, None] * self.directions[segment]
+
+    def slot(self, customer):
+        # slot of a waiting customer, its position among the customers which are not served yet
+        return self.resource.position(customer) - self.resource.count + 1
+
+    def join(self, customer):
+        # position of the slot a customer which has to wait walks to, called after its request
+        return self.slots([self.slot(customer)])[0]
+
+    def arrive(self, customer):
+        # the customer reached its slot, the line may have moved up in the meantime
+        self.standing[customer] = None
+        customer.step_to(self.slots([self.slot(customer)])[0])
+
+    def advance(self, _=None):
+        # customers whose request was granted leave the line, everybody standing in line moves up
+        for customer in [c for c in self.standing if c.request.triggered]:
+            del self.standing[customer]
+        if not self.standing:
+            return
+        for customer, slot in zip(self.standing, self.slots([self.slot(c) for c in self.standing])):
+            customer.step_to(slot)
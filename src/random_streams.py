@@ -0,0 +1,211 @@
+from scipy.special import ndtr, ndtri
+from scipy.stats import poisson
+from numpy import random as npr
+import numpy as np
+import math
+import zlib
+
+
+# sources which are mirrored in antithetic replications: arrivals, service times and walking speeds
+ANTITHETIC_SOURCES = ("arrival_counts", "arrivals", "walking_speed", "search", "scan", "payment")
+# uniform numbers drawn at a time by a substream, a multiple of the four numbers of a Philox counter step
+SUBSTREAM_BLOCK = 16
+# sources of a customer, they share the substream of the customer id together with the service times
+CUSTOMER_SOURCES = ("item_location", "search", "scan", "payment")
+
+
+def stream_counter(source, *key):
+    """
+    initial counter of the Philox substream of a stochastic source. the source and up to two key values (e.g. the
+    customer id) fill the upper words, the lowest word counts the draws, so the substreams never overlap and only depend
+    on the key of the replication, the source and the key, not on how many numbers were drawn elsewhere
+    """
+    if len(key) > 2:
+        raise ValueError(f"substreams are keyed by at most two values, got {key}")
+    padded = (0,) * (2 - len(key)) + tuple(key)
+    return np.array([0, padded[1], padded[0], zlib.crc32(source.encode()) | len(key) << 32], dtype=np.uint64)
+
+
+class RandomStreams:
+    """
+    random number generators for the stochastic sources of a customer or a block of arrivals, indexed by source name.
+    with a generator every source draws from it. with the Philox key of a replication (root given) each source gets its
+    own counter based substream keyed by e.g. the customer id, so a customer behaves the same no matter when it is
+    created or how many numbers other customers drew, also across scenarios with common random numbers.
+    the given sources share the substream of the key instead: it is split into blocks taken by the sources in turn,
+    so their first blocks are drawn at once. all substreams of a replication are drawn by the PhiloxBlocks given.
+    antithetic (None, False or True) mirrors the antithetic sources if True
+    """
+
+    def __init__(self, generator=None, root=None, key=(), antithetic=None, blocks=None, sources=()):
+        self.generator = generator
+        self.root = root
+        self.key = tuple(key)
+        self.antithetic = antithetic
+        self.blocks = blocks if blocks is not None or root is None else PhiloxBlocks(root)
+        self.sources = tuple(sources)
+        self.shared_counter = None
+        self.first_blocks = None  # first block of every shared source, drawn once the first of them is used
+        self.streams = {}
+        self.buffers = {}
+
+    def __getitem__(self, source):
+        if self.root is None:
+            return self.generator
+        if source not in self.streams:
+            # substreams are only created once they are used, they need no generator of their own
+            mirrored = self.antithetic is True and (source in ANTITHETIC_SOURCES or source.startswith("service_"))
+            if source in self.sources:
+                if self.first_blocks is None:
+                    self.shared_counter = stream_counter("", *self.key)  # the shared substream has no source
+                    self.first_blocks = self.blocks.draw(self.shared_counter, len(self.sources) * SUBSTREAM_BLOCK)
+                # block k of the i-th source is block k * len(sources) + i of the shared substream
+                i = self.sources.index(source)
+                first_block = self.first_blocks[i * SUBSTREAM_BLOCK:(i + 1) * SUBSTREAM_BLOCK]
+                self.streams[source] = Substream(self.blocks, self.shared_counter, mirrored,
+                                                 position=(len(self.sources) + i) * SUBSTREAM_BLOCK // 4,
+                                                 stride=len(self.sources), values=first_block)
+            else:
+                self.streams[source] = Substream(self.blocks, stream_counter(source, *self.key), mirrored)
+        return self.streams[source]
+
+    def sample(self, source, dist, size=None):
+        """
+        draw from a distribution with an inverse cdf (ppf) by inversion. the variates are taken from a buffer per
+        source filled a block at a time, so every source has to sample a single distribution
+        """
+        if source not in self.buffers:
+            self.buffers[source] = VariateBuffer(self[source], dist, SUBSTREAM_BLOCK)
+        return self.buffers[source].take(size)
+
+
+class PhiloxBlocks:
+    """
+    draws blocks of uniform numbers of the Philox substreams of a key with a single generator, which is moved to the
+    counter of the block before drawing. this costs less than creating a generator per substream
+    """
+
+    def __init__(self, key):
+        self.bit_generator = npr.Philox(key=key)
+        self.generator = npr.Generator(self.bit_generator)
+        self.state = self.bit_generator.state
+
+    def draw(self, counter, size, position=0):
+        """
+        size uniform numbers following position counter steps after the counter, the same as
+        npr.Philox(key=key, counter=counter) would draw after 4 * position numbers
+        """
+        self.state["state"]["counter"] = counter + np.array([position, 0, 0, 0], dtype=np.uint64)
+        self.state["buffer_pos"] = 4  # the buffered outputs are used up, the next draw increments the counter
+        self.bit_generator.state = self.state
+        return self.generator.random(size)
+
+
+class Substream:
+    """
+    uniform numbers of a Philox substream drawn block_size at a time. the next block starts position counter steps
+    after the counter, a step yields four numbers and stride blocks of other sources are skipped after every block.
+    every variate is drawn by inversion of a single uniform number. the mirrored substream of an antithetic pair uses
+    1 - u instead of u, so both members of the pair see negatively correlated samples
+    """
+
+    def __init__(self, blocks, counter, mirrored=False, block_size=SUBSTREAM_BLOCK, position=0, stride=1,
+                 values=None):
+        self.blocks = blocks
+        self.counter = counter
+        self.position = position
+        self.mirrored = mirrored
+        self.block_size = block_size
+        self.stride = stride
+        self.values = values if values is not None else np.zeros(0)
+        self.next = 0
+
+    def refill(self, count):
+        # keep the remaining numbers and append as many blocks as needed, consecutive blocks are drawn at once
+        blocks = (count - (len(self.values) - self.next) - 1) // self.block_size + 1
+        parts = [self.values[self.next:]] if self.next < len(self.values) else []
+        for size in [blocks] if self.stride == 1 else [1] * blocks:
+            parts.append(self.blocks.draw(self.counter, size * self.block_size, self.position))
+            self.position += self.stride * size * self.block_size // 4
+        self.values = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        self.next = 0
+
+    def random(self, size=None):
+        if size is None:
+            if self.next == len(self.values):
+                self.refill(1)
+            u = float(self.values[self.next])
+            self.next += 1
+            return 1.0 - u if self.mirrored else u
+        count = math.prod(size) if isinstance(size, tuple) else size
+        if self.next + count > len(self.values):
+            self.refill(count)
+        u = self.values[self.next:self.next + count]
+        self.next += count
+        if self.mirrored:
+            u = 1.0 - u
+        return u.reshape(size)
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return low + (high - low) * self.random(size)
+
+    def exponential(self, scale=1.0, size=None):
+        return -scale * np.log1p(-self.random(size))
+
+    def triangular(self, left, mode, right, size=None):
+        return triangular_ppf(self.random(size), left, mode, right)
+
+    def poisson(self, lam=1.0, size=None):
+        return poisson.ppf(self.random(size), lam).astype(np.int64)[()]
+
+
+class VariateBuffer:
+    """
+    variates of a distribution sampled by inversion of block_size uniform numbers at a time
+    """
+
+    def __init__(self, generator, dist, block_size=SUBSTREAM_BLOCK):
+        self.generator = generator
+        self.dist = dist
+        self.block_size = block_size
+        self.values = np.zeros(0)
+        self.next = 0
+
+    def take(self, size=None):
+        count = 1 if size is None else size
+        if self.next + count > len(self.values):
+            # keep the remaining variates and append as many blocks as needed
+            blocks = (count - (len(self.values) - self.next) - 1) // self.block_size + 1
+            self.values = np.concatenate((self.values[self.next:],
+                                          self.dist.ppf(self.generator.random(blocks * self.block_size))))
+            self.next = 0
+        values = self.values[self.next:self.next + count]
+        self.next += count
+        return values[0] if size is None else values
+
+
+class TruncatedNormal:
+    """
+    normal distribution truncated to [loc + a * scale, loc + b * scale], the same as scipy.stats.truncnorm but with a
+    cheap inverse cdf for sampling by inversion
+    """
+
+    def __init__(self, a, b, loc=0.0, scale=1.0):
+        self.a = a
+        self.b = b
+        self.loc = loc
+        self.scale = scale
+        self.cdf_a = ndtr(a)
+        self.cdf_b = ndtr(b)
+
+    def ppf(self, q):
+        return self.loc + self.scale * ndtri(self.cdf_a + q * (self.cdf_b - self.cdf_a))
+
+
+def triangular_ppf(u, left, mode, right):
+    """
+    inverse of the cumulative distribution function of the triangular distribution
+    """
+    split = (mode - left) / (right - left)
+    return np.where(u < split, left + np.sqrt(u * (right - left) * (mode - left)),
+                    right - np.sqrt((1.0 - u) * (right - left) * (right - mode)))[()]
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import pathlib
+import pickle
+import shutil
+
+import numpy as np
+
+
+_model_fingerprint = None
+
+
+def model_fingerprint():
+    """
+    hash of the source of all model modules, cached results are invalidated whenever the model code changes
+    """
+    global _model_fingerprint
+    if _model_fingerprint is None:
+        digest = hashlib.sha256()
+        for path in sorted(pathlib.Path(__file__).parent.glob("*.py")):
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+        _model_fingerprint = digest.hexdigest()
+    return _model_fingerprint
+
+
+def config_hash(config):
+    """
+    hash of the normalized config. flags only change the console output and the event trace and are ignored,
+    Simulation does not use the cache while either of them is on
+    """
+    config = dict(config)
+    config["Customer"] = {k: v for k, v in config["Customer"].items() if k != "flags"}
+    normalized = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256((normalized + model_fingerprint()).encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    content addressed on-disk cache of the RunRecords of single replications. entries are grouped per config in
+    directory/<config hash>/<run hash>.pkl, where the config hash includes the model fingerprint and the run hash the
+    seed and random number options. the cache is bounded to max_bytes, least recently used entries are evicted first
+    """
+
+    def __init__(self, directory=".simulation_cache", max_bytes=2 * 1024 ** 3):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, config, seed, common_random_numbers=False, antithetic=None):
+        seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        run = repr((seed.entropy, seed.spawn_key, seed.pool_size, common_random_numbers, antithetic))
+        return self.directory / config_hash(config) / (hashlib.sha256(run.encode()).hexdigest() + ".pkl")
+
+    def load(self, path):
+        try:
+            with open(path, "rb") as file:
+                record = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        os.utime(path)  # mark as recently used
+        return record
+
+    def store(self, path, record):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temporary, "wb") as file:
+            pickle.dump(record, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)  # atomic, concurrent writers of the same entry write identical results
+        self.evict()
+
+    def entries(self):
+        return [(entry.stat().st_mtime, entry.stat().st_size, entry) for entry in self.directory.glob("*/*.pkl")]
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries(), key=lambda e: e[0])
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+
+    def invalidate(self, config=None):
+        """
+        remove all cached runs of the given config, or the whole cache if no config is given
+        """
+        if config is None:
+            targets = [p for p in self.directory.iterdir() if p.is_dir()]
+        else:
+            targets = [self.directory / config_hash(config)]
+        for target in targets:
+            shutil.rmtree(target, ignore_errors=True)
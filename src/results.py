@@ -0,0 +1,242 @@
+import numpy as np
+
+
+class ResourceLog:
+    """
+    analysis methods shared by live TracedResources and their compact ResourceRecords.
+    requires capacity_log, log_event and log_time attributes
+    """
+
+    def capacities(self, time):
+        # capacity in effect at the given times, the capacity log holds (time, capacity) from that time on
+        change_times, capacities = zip(*self.capacity_log)
+        return np.asarray(capacities)[np.maximum(np.searchsorted(change_times, time, side="right") - 1, 0)]
+
+    def availability(self):
+        demand = np.cumsum(np.asarray(self.log_event))
+        time = np.asarray(self.log_time)
+        return self.capacities(time) - demand, time
+
+    def queue_length(self):
+        available, time = self.availability()
+        available[available > 0] = 0
+        return available * -1, time
+
+
+def queue_length_integral(resource):
+    """
+    integral of the queue length over time and the logged duration of a resource, or of all resources in a list
+    (meaning we're dealing with checkouts). the average queue length is the ratio of both
+    """
+    if not isinstance(resource, list):
+        resource = [resource]
+    numerator = 0
+    denominator = 0
+    for res in resource:
+        queue_length, time = res.queue_length()
+        if len(time) == 0:
+            continue  # resource was never used in this run
+        numerator += np.sum(queue_length[:-1] * np.diff(time))
+        denominator += max(time)
+    return numerator, denominator
+
+
+def stockout_integral(resource):
+    """
+    time during which no capacity of a resource (or of all resources in a list) was available and the logged duration.
+    the fraction of time the resource was out of stock is the ratio of both
+    """
+    if not isinstance(resource, list):
+        resource = [resource]
+    numerator = 0
+    denominator = 0
+    for res in resource:
+        available, time = res.availability()
+        if len(time) == 0:
+            continue  # resource was never used in this run
+        numerator += np.sum(np.diff(time)[available[:-1] <= 0])
+        denominator += max(time)
+    return numerator, denominator
+
+
+class ResourceRecord(ResourceLog):
+    """
+    compact, picklable copy of a TracedResource after a run has finished
+    """
+
+    def __init__(self, name, capacity, log_event, log_time, capacity_log=None):
+        self.name = name
+        self.capacity = capacity  # final capacity
+        self.log_event = log_event
+        self.log_time = log_time
+        self.capacity_log = capacity_log if capacity_log is not None else [(0.0, capacity)]
+
+    @classmethod
+    def from_resource(cls, resource):
+        return cls(resource.name, resource.capacity, list(resource.log_event), list(resource.log_time),
+                   list(resource.capacity_log))
+
+
+class CustomerTable:
+    """
+    struct of arrays holding the results of the customers which left the store, one row per customer in order of
+    their exit. wait and use times are stored per resource key, NaN if the customer did not use the resource
+    """
+
+    def __init__(self, keys, capacity=0):
+        self.keys = {key: k for k, key in enumerate(keys)}
+        self.route_names = []  # routes indexed by the route column
+        self.route_ids = dict()
+        self.size = 0
+        self.ucid = np.zeros(capacity, dtype=np.int64)
+        self.start = np.zeros(capacity)
+        self.exit = np.zeros(capacity)
+        self.basket = np.zeros(capacity, dtype=bool)
+        self.route = np.zeros(capacity, dtype=np.int16)
+        self.wait = np.full((capacity, len(self.keys)), np.nan)
+        self.use = np.full((capacity, len(self.keys)), np.nan)
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, capacity):
+        # grow the preallocated columns to hold at least capacity rows
+        if capacity <= len(self.ucid):
+            return
+        capacity = max(capacity, 2 * len(self.ucid))
+        for column in ("ucid", "start", "exit", "basket", "route"):
+            values = getattr(self, column)
+            setattr(self, column, np.concatenate((values, np.zeros(capacity - len(values), dtype=values.dtype))))
+        for column in ("wait", "use"):
+            values = getattr(self, column)
+            setattr(self, column, np.concatenate((values, np.full((capacity - len(values), len(self.keys)), np.nan))))
+
+    def add(self, customer):
+        if self.size == len(self.ucid):
+            self.reserve(self.size + 1)
+        route = str(customer.route)
+        if route not in self.route_ids:
+            self.route_ids[route] = len(self.route_names)
+            self.route_names.append(route)
+        row = self.size
+        self.ucid[row] = customer.ucid
+        self.start[row] = customer.start_time
+        self.exit[row] = customer.exit_time
+        self.basket[row] = customer.basket
+        self.route[row] = self.route_ids[route]
+        for key, value in customer.wait_times.items():
+            self.wait[row, self.keys[key]] = value
+        for key, value in customer.use_times.items():
+            self.use[row, self.keys[key]] = value
+        self.size += 1
+
+    def trimmed(self):
+        # copy without the unused preallocated rows
+        table = CustomerTable(self.keys)
+        table.route_names = list(self.route_names)
+        table.route_ids = dict(self.route_ids)
+        table.size = self.size
+        for column in ("ucid", "start", "exit", "basket", "route", "wait", "use"):
+            setattr(table, column, getattr(self, column)[:self.size].copy())
+        return table
+
+    def resource_times(self, column, key):
+        """
+        wait, use or total times of the customers which used the resource key. baskets and shopping_carts select the
+        container times of customers with a basket or a cart
+        """
+        if key in ("baskets", "shopping_carts"):
+            rows = self.basket[:self.size] == (key == "baskets")
+            key = "container"
+        else:
+            rows = slice(None)
+        if key not in self.keys:
+            return np.zeros(0)
+        if column == "total":
+            times = self.wait[:self.size, self.keys[key]] + self.use[:self.size, self.keys[key]]
+        else:
+            times = getattr(self, column)[:self.size, self.keys[key]]
+        times = times[rows]
+        return times[~np.isnan(times)]
+
+
+class CustomerLog:
+    """
+    analysis methods shared by the CustomerFactory and the compact RunRecord.
+    requires a customer_table attribute holding the CustomerTable of the run
+    """
+
+    def wait_times(self, key):
+        return self.customer_table.resource_times("wait", key)
+
+    def use_times(self, key):
+        return self.customer_table.resource_times("use", key)
+
+    def total_times(self, key):
+        return self.customer_table.resource_times("total", key)
+
+    @property
+    def store_times(self):
+        """ time spent in the store """
+        table = self.customer_table
+        return table.exit[:table.size] - table.start[:table.size]
+
+    @property
+    def start_times(self):
+        return self.customer_table.start[:self.customer_table.size]
+
+    @property
+    def simulation_end_time(self):
+        # total simulation runs from zero until the last customer leaves the store
+        return self.customer_table.exit[:self.customer_table.size].max()
+
+
+class DepartmentRecord:
+    """
+    compact copy of the department logs after a run has finished
+    """
+
+    def __init__(self, name, log_event, log_time, queue=None):
+        self.name = name
+        self.log_event = log_event
+        self.log_time = log_time
+        self.queue = queue
+
+    def customers_inside(self):
+        return np.cumsum(np.asarray(self.log_event)), np.asarray(self.log_time)
+
+
+class RunRecord(CustomerLog):
+    """
+    compact, picklable result of a single replication. replaces the resource, customer factory and department
+    entries of the Simulation logs when a run was executed in a worker process
+    """
+
+    def __init__(self, resources, customer_table, departments):
+        self.resources = resources
+        self.customer_table = customer_table
+        self.departments = departments
+
+    @classmethod
+    def from_replication(cls, resources, customer_factory, departments):
+        records = dict()  # keyed by id so resources shared between logs stay shared after pickling
+
+        def record(resource):
+            if id(resource) not in records:
+                records[id(resource)] = ResourceRecord.from_resource(resource)
+            return records[id(resource)]
+
+        resource_records = dict()
+        for key, resource in resources.items():
+            if isinstance(resource, list):
+                resource_records[key] = [record(r) for r in resource]
+            else:
+                resource_records[key] = record(resource)
+
+        department_records = dict()
+        for key, department in departments.items():
+            queue = record(department.queue) if department.queue is not None else None
+            department_records[key] = DepartmentRecord(department.name, list(department.log_event),
+                                                       list(department.log_time), queue)
+
+        return cls(resource_records, customer_factory.customer_table.trimmed(), department_records)
@@ -0,0 +1,197 @@
+"""
+long-lived local simulation service. replications run on a pool of worker processes which are started and warmed up
+(modules imported, store layout built once) when the service starts, so a what-if request only pays for its runs.
+
+requests are plain HTTP with JSON bodies:
+    GET  /health     pool size and number of requests in progress
+    POST /simulate   {"overrides": {...}, "runs": 10, "seed": 0, "common_random_numbers": true, "antithetic": false,
+                      "confidence": 0.95}
+the response of /simulate is streamed as newline delimited JSON: one "replication" line per finished run and a final
+"result" line with the KPI estimates (see sweep.SUMMARY_KPIS). if a replication fails, an "error" line ends the stream
+instead. overrides which do not give a valid store are rejected with 400 before anything runs.
+
+start the service with:
+    python -m src.service [config path] [port]
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import json
+import math
+import os
+import sys
+
+import numpy as np
+import simpy
+
+from src.simulation import Simulation, run_replication
+from src.store import Store
+from src.sweep import SUMMARY_KPIS, apply_overrides
+from src.precision import confidence_interval
+
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+def warm_up(config):
+    """
+    worker initializer: the heavy imports are done by importing this module, building the store once initializes the
+    remaining lazily created state
+    """
+    Store(simpy.Environment(), config)
+
+
+def ready():
+    return os.getpid()
+
+
+def json_value(value):
+    # NaN and inf are not valid JSON
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+class SimulationService:
+
+    def __init__(self, config, workers=None, host="127.0.0.1", port=8080, cache=None):
+        if not isinstance(config, dict):
+            with open(config) as config:  # if it's a path, read the file
+                config = json.load(config)
+        # console output of the workers is not forwarded
+        self.config = apply_overrides(config, {"Customer": {"flags": {"print": False}}})
+
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.host = host
+        self.port = port
+        self.cache = cache
+        self.pool = None
+        self.active = 0
+
+    async def start(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up, initargs=(self.config,))
+        # worker processes are only started on demand, keep them all busy once so every worker is warm
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, ready) for _ in range(self.workers)])
+        return await asyncio.start_server(self.handle, self.host, self.port)
+
+    async def serve(self):
+        server = await self.start()
+        print(f"simulation service listening on http://{self.host}:{self.port} with {self.workers} workers")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, body = await self.read_request(reader)
+            if path == "/health":
+                await self.respond(writer, 200, {"status": "ok", "workers": self.workers, "active": self.active})
+            elif path != "/simulate":
+                await self.respond(writer, 404, {"error": f"unknown path {path}"})
+            elif method != "POST":
+                await self.respond(writer, 405, {"error": "use POST to start a simulation"})
+            else:
+                try:
+                    simulation, runs, confidence = self.parse_job(json.loads(body or b"{}"))
+                except (ValueError, TypeError, KeyError) as error:
+                    await self.respond(writer, 400, {"error": str(error)})
+                else:
+                    await self.stream(writer, simulation, runs, confidence)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # client went away
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        method, path, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        length = 0
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        body = await reader.readexactly(length) if length > 0 else b""
+        return method, path.split("?")[0], body
+
+    async def respond(self, writer, status, payload):
+        body = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    def parse_job(self, job):
+        if not isinstance(job, dict):
+            raise ValueError("the request body must be a JSON object")
+        runs = int(job.get("runs", 10))
+        if runs < 1:
+            raise ValueError("at least one run is needed")
+        config = apply_overrides(self.config, job.get("overrides", {}))
+        try:
+            Store(simpy.Environment(), config)  # a bad override would otherwise only fail in the workers
+        except Exception as error:
+            raise ValueError(f"invalid overrides: {type(error).__name__}: {error}") from error
+        simulation = Simulation(config, runs=runs, seed=int(job.get("seed", 0)),
+                                common_random_numbers=bool(job.get("common_random_numbers", True)),
+                                antithetic=bool(job.get("antithetic", False)), cache=self.cache)
+        return simulation, runs, float(job.get("confidence", 0.95))
+
+    async def stream(self, writer, simulation, runs, confidence):
+        """
+        run the replications of one request on the pool and stream their progress. the response has no length, it
+        ends when the connection is closed
+        """
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+
+        async def line(payload):
+            writer.write(json.dumps(payload).encode() + b"\n")
+            await writer.drain()
+
+        loop = asyncio.get_running_loop()
+        records = simulation.load_cached(range(runs))
+        futures = {asyncio.ensure_future(loop.run_in_executor(self.pool, run_replication, simulation.config,
+                                                              *simulation.replication_arguments(run))): run
+                   for run in range(runs) if run not in records}
+        self.active += 1
+        try:
+            for completed, (run, record) in enumerate(records.items(), 1):
+                await line({"event": "replication", "run": run, "completed": completed,
+                            "runs": runs, "cached": True, "store_time": json_value(np.mean(record.store_times))})
+            pending = set(futures)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    run = futures[future]
+                    records[run] = future.result()
+                    if simulation.cache is not None:
+                        simulation.cache.store(simulation.cache_path(run), records[run])
+                    await line({"event": "replication", "run": run, "completed": len(records), "runs": runs,
+                                "cached": False, "store_time": json_value(np.mean(records[run].store_times))})
+        except (ConnectionError, asyncio.CancelledError):
+            for future in futures:
+                future.cancel()  # runs which did not start yet are dropped
+            raise
+        except Exception as error:
+            for future in futures:
+                future.cancel()
+            await line({"event": "error", "run": run, "error": f"{type(error).__name__}: {error}"})
+            return
+        finally:
+            self.active -= 1
+
+        for run in range(runs):
+            simulation.add_record(records[run])
+        kpis = []
+        for kpi, key in SUMMARY_KPIS:
+            mean, half_width = confidence_interval(simulation.estimation_values(kpi, key), confidence)
+            kpis.append({"kpi": kpi, "key": key, "mean": json_value(mean), "half_width": json_value(half_width)})
+        await line({"event": "result", "runs": simulation.runs, "confidence": confidence, "kpis": kpis})
+
+
+if __name__ == "__main__":
+    service = SimulationService(sys.argv[1] if len(sys.argv) > 1 else "config.json",
+                                port=int(sys.argv[2]) if len(sys.argv) > 2 else 8080)
+    asyncio.run(service.serve())
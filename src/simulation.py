@@ -1,4 +1,7 @@
 import os
+from time import monotonic
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 import simpy
 import json
@@ -10,8 +13,56 @@ from scipy.signal import savgol_filter
 from src.TracedResource import TracedResource
 from src.customer_factory import CustomerFactory
 from src.customer_visualization import Visualization
+from src.queue_line import QueueLine
 from src.store import Store
 from src.plotting import plot_average
+from src.results import RunRecord, queue_length_integral, stockout_integral
+from src.precision import confidence_interval
+from src.result_cache import ResultCache
+
+
+# resource KPIs which are averaged over time, mapped to the function returning their integral and duration
+TIME_AVERAGED_KPIS = {"average_queue_length": queue_length_integral, "stockout_fraction": stockout_integral}
+
+
+def setup_replication(env, config, seed, common_random_numbers=False, antithetic=None):
+    """
+    build the store, shared resources and customers of a single replication in the given environment
+    """
+    store = Store(env, config)
+    #store.plot()
+
+    # initialize shared resources
+    resources = dict()
+    resources["shopping_carts"] = TracedResource(env,
+                                                 capacity=config["resource quantities"]["shopping_carts"],
+                                                 name="Shopping carts",
+                                                 accociated_node=store.path_grid.nodes[1])
+    resources["baskets"] = TracedResource(env, capacity=config["resource quantities"]["baskets"],
+                                          name="Baskets", accociated_node=store.path_grid.nodes[1])
+
+    resources["checkout"] = store.checkouts.lanes
+    resources["C"] = store.departments["C"].queue
+    resources["D"] = store.departments["D"].queue
+    for resource in resources["checkout"] + [resources["C"], resources["D"]]:
+        QueueLine(resource, store.path_grid, config["Customer"]["size"])
+
+    # initialize the customer factory
+    customer_factory = CustomerFactory(env, config, store, resources, seed=seed,
+                                       common_random_numbers=common_random_numbers, antithetic=antithetic)
+    customer_factory.run()
+
+    return store, resources, customer_factory
+
+
+def run_replication(config, seed, common_random_numbers=False, antithetic=None):
+    """
+    run a single replication and return its compact RunRecord. module level so it can be used by worker processes
+    """
+    env = simpy.Environment()
+    store, resources, customer_factory = setup_replication(env, config, seed, common_random_numbers, antithetic)
+    env.run()
+    return RunRecord.from_replication(resources, customer_factory, store.departments)
 
 
 class Simulation:
@@ -20,8 +71,18 @@ class Simulation:
     the class stores simulation results for postprocessing
     """
 
-    def __init__(self, config, runs=1, overwrite_print = None, visualization=False):
+    def __init__(self, config, runs=1, overwrite_print = None, visualization=False, workers=1, seed=0,
+                 common_random_numbers=False, antithetic=False, cache=None):
         self.runs = runs
+        self.workers = workers
+        self.seed_sequence = np.random.SeedSequence(seed)
+        # draw every stochastic source of every customer from its own substream, so scenarios compared with the same
+        # seed see the same customers
+        self.common_random_numbers = common_random_numbers
+        # consecutive runs form antithetic pairs sharing a seed, the second run of a pair uses mirrored streams
+        self.antithetic = antithetic
+        if self.antithetic and self.runs % 2 != 0:
+            raise ValueError("antithetic replications need an even number of runs")
 
         if isinstance(config, dict):
             self.config = config
@@ -32,47 +93,110 @@ class Simulation:
         if overwrite_print is not None:
             if isinstance(overwrite_print, bool):
                 self.config["Customer"]["flags"]["print"] = overwrite_print
+        self.check_trace_path(self.runs)
 
         self.visualization = visualization
-
+        if self.visualization and self.workers > 1:
+            raise ValueError("visualization is only available for runs in the main process (workers=1)")
+
+        # results of single runs are loaded from and stored in the cache (a ResultCache or its directory)
+        flags = self.config["Customer"]["flags"]
+        if cache is not None and (flags["print"] or flags.get("trace", False)):
+            # runs loaded from the cache would print and trace nothing
+            print("console output or event trace is on, the result cache is not used")
+            cache = None
+        if cache is not None and not isinstance(cache, ResultCache):
+            cache = ResultCache(cache)
+        self.cache = cache
 
         self.resourceLog = []
         self.customerLog = []
         self.departmentLog = []
 
+    def replication_seed(self, run):
+        """
+        seed sequence of the given run. equal to the run-th child of SeedSequence(seed).spawn(...) but independent of
+        how many runs were spawned before, so results do not depend on the order or process the runs are executed in
+        """
+        return np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=self.seed_sequence.spawn_key + (run,),
+                                      pool_size=self.seed_sequence.pool_size)
+
+    def replication_arguments(self, run):
+        """
+        seed, common random numbers and antithetic arguments used by setup_replication for the given run
+        """
+        if self.antithetic:
+            return self.replication_seed(run // 2), True, run % 2 == 1
+        return self.replication_seed(run), self.common_random_numbers, None
+
+    def check_trace_path(self, runs):
+        """
+        every replication truncates its trace file, so a trace path written by more than one of the given number of
+        runs has to tell them apart by "{replication}"
+        """
+        trace = self.config["Customer"]["flags"].get("trace", False)
+        if isinstance(trace, str) and runs > 1 and "{replication}" not in trace:
+            raise ValueError(f'the trace file "{trace}" would be overwritten by each of {runs} runs, add '
+                             f'"{{replication}}" to its path')
+
+    def cache_path(self, run):
+        return self.cache.path(self.config, *self.replication_arguments(run))
+
+    def load_cached(self, runs):
+        """
+        RunRecords of the given runs found in the cache, keyed by run index
+        """
+        records = dict()
+        if self.cache is not None:
+            for run in runs:
+                record = self.cache.load(self.cache_path(run))
+                if record is not None:
+                    records[run] = record
+        return records
+
     def run(self):
         """
         main function used for running the simulation(s)
         """
-        for run in range(self.runs):
-            env = simpy.Environment()
+        self.run_replications(range(self.runs))
 
-            store = Store(env, self.config)
-            #store.plot()
-
-            # initialize shared resources
-            resources = dict()
-            resources["shopping_carts"] = TracedResource(env,
-                                                         capacity=self.config["resource quantities"]["shopping_carts"],
-                                                         name="Shopping carts",
-                                                         accociated_node=store.path_grid.nodes[1])
-            resources["baskets"] = TracedResource(env, capacity=self.config["resource quantities"]["baskets"],
-                                                  name="Baskets", accociated_node=store.path_grid.nodes[1])
-
-            resources["checkout"] = [
-                TracedResource(env, capacity=1, name="Checkout 0", accociated_node=store.path_grid.nodes[71]),
-                TracedResource(env, capacity=1, name="Checkout 1", accociated_node=store.path_grid.nodes[72]),
-                TracedResource(env, capacity=1, name="Checkout 2", accociated_node=store.path_grid.nodes[73]),
-                TracedResource(env, capacity=1, name="Checkout 3", accociated_node=store.path_grid.nodes[74])
-            ]
-            resources["C"] = store.departments["C"].queue
-            resources["D"] = store.departments["D"].queue
+    def run_replications(self, runs):
+        """
+        run the given run indices and append their results to the logs
+        """
+        runs = list(runs)
+        if self.antithetic and set(runs) != {run ^ 1 for run in runs}:
+            raise ValueError("antithetic replications are run in complete pairs (2k, 2k + 1)")
+        self.check_trace_path(len(self.customerLog) + len(runs))
+        records = self.load_cached(runs)
+        missing = [run for run in runs if run not in records]
+
+        if self.workers > 1:
+            # fan the replications out over a process pool, results are returned in run order
+            if missing:
+                with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                    results = pool.map(run_replication, repeat(self.config),
+                                       *zip(*[self.replication_arguments(run) for run in missing]))
+                    for run, record in zip(missing, results):
+                        print(f"finished run {run}")
+                        records[run] = record
+                        if self.cache is not None:
+                            self.cache.store(self.cache_path(run), record)
+            for run in runs:
+                self.add_record(records[run])
+            return
+
+        for run in runs:
+            if run in records:
+                print(f"loaded run {run} from cache")
+                self.add_record(records[run])
+                continue
 
-            self.departmentLog.append(store.departments)
+            env = simpy.Environment()
+            store, resources, customer_factory = setup_replication(env, self.config,
+                                                                   *self.replication_arguments(run))
 
-            # initialize the customer factory, SEED EQUAL TO THE RUN INDEX
-            customer_factory = CustomerFactory(env, self.config, store, resources, seed=run)
-            customer_factory.run()
+            self.departmentLog.append(store.departments)
 
             if self.visualization:
                 visualization = Visualization(store, customer_factory, env, np.asarray([40.0, 30.0]))
@@ -85,6 +209,113 @@ class Simulation:
             # store results
             self.resourceLog.append(resources)
             self.customerLog.append(customer_factory)
+            if self.cache is not None:
+                self.cache.store(self.cache_path(run),
+                                 RunRecord.from_replication(resources, customer_factory, store.departments))
+        self.runs = len(self.customerLog)
+
+    def add_record(self, record):
+        """
+        append the compact RunRecord of a replication run elsewhere (e.g. in a worker process) to the logs
+        """
+        self.resourceLog.append(record.resources)
+        self.customerLog.append(record)
+        self.departmentLog.append(record.departments)
+        self.runs = len(self.customerLog)
+
+    def run_until_precision(self, targets, batch_size=None, max_runs=1000, max_time=None):
+        """
+        keep adding replications in batches until every PrecisionTarget is met, or until max_runs replications were
+        made or max_time seconds of wall clock time have passed. the replications already in the logs are reused
+        """
+        if batch_size is None:
+            batch_size = max(self.workers, 2)
+        self.runs = len(self.customerLog)
+        if self.antithetic:
+            # only complete antithetic pairs are run, so the stopping rule is only checked between pairs
+            if max_runs % 2 != 0 or self.runs % 2 != 0:
+                raise ValueError(f"antithetic replications need an even number of runs, got max_runs={max_runs} and "
+                                 f"{self.runs} runs in the logs")
+            batch_size += batch_size % 2
+        self.check_trace_path(max_runs)
+        start = monotonic()
+
+        while True:
+            met = self.runs >= 2 and all(target.is_met(self.estimation_values(target.kpi, target.key))
+                                         for target in targets)
+            if met:
+                reason = "precision reached"
+                break
+            if self.runs >= max_runs:
+                reason = "replication budget exhausted"
+                break
+            if max_time is not None and monotonic() - start >= max_time:
+                reason = "time budget exhausted"
+                break
+            self.run_replications(range(self.runs, min(self.runs + batch_size, max_runs)))
+
+        estimates = {target.label: target.estimate(self.estimation_values(target.kpi, target.key))
+                     for target in targets}
+        print('---------------------------------')
+        print(f"{reason} after {self.runs} runs")
+        for label, (mean, half_width) in estimates.items():
+            print("{}: {:.2f} +- {:.2f}".format(label, mean, half_width))
+        print('---------------------------------')
+        return {"runs": self.runs, "converged": met, "reason": reason, "estimates": estimates}
+
+    def replication_values(self, kpi, key=None):
+        """
+        per-run estimate of a KPI, these replication means are the independent samples for confidence intervals
+        """
+        values = np.full(self.runs, np.nan)
+        for run in range(self.runs):
+            if kpi in TIME_AVERAGED_KPIS:
+                integral, duration = TIME_AVERAGED_KPIS[kpi](self.resourceLog[run][key])
+                if duration > 0:
+                    values[run] = integral / duration
+                continue
+            if key is None:
+                samples = getattr(self.customerLog[run], kpi)
+            else:
+                samples = getattr(self.customerLog[run], kpi)(key)
+            if len(samples) > 0:
+                values[run] = np.mean(samples)
+        return values
+
+    def estimation_values(self, kpi, key=None):
+        """
+        independent samples of a KPI: the replication means, or the pair means for antithetic replications
+        """
+        values = self.replication_values(kpi, key)
+        if self.antithetic:
+            if len(values) % 2 != 0:
+                raise ValueError(f"antithetic estimates need complete pairs of runs, got {len(values)} runs")
+            return (values[0::2] + values[1::2]) / 2
+        return values
+
+    def antithetic_estimate(self, kpi, key=None, confidence=0.95):
+        """
+        paired antithetic estimator of a KPI. returns the estimate, the variance of the estimator and the half width of
+        its confidence interval
+        """
+        if not self.antithetic:
+            raise ValueError("the simulation was not run with antithetic replications")
+        pair_means = self.estimation_values(kpi, key)
+        pair_means = pair_means[~np.isnan(pair_means)]
+        mean, half_width = confidence_interval(pair_means, confidence)
+        return mean, pair_means.var(ddof=1) / len(pair_means), half_width
+
+    def print_antithetic_estimates(self, confidence=0.95):
+        print('---------------------------------')
+        print(f"antithetic estimates over {self.runs // 2} pairs (estimate/variance/{confidence:.0%} half width)")
+        mean, variance, half_width = self.antithetic_estimate("store_times", confidence=confidence)
+        print("store time [s]: {:.2f}/{:.4f}/{:.2f}".format(mean, variance, half_width))
+        for key in ("shopping_carts", "baskets", "C", "D", "checkout"):
+            for kpi in ("wait_times", "use_times"):
+                mean, variance, half_width = self.antithetic_estimate(kpi, key, confidence)
+                print("{} {} [s]: {:.2f}/{:.4f}/{:.2f}".format(key, kpi.replace("_", " ")[:-1], mean, variance,
+                                                               half_width))
+        print('---------------------------------')
 
     def wait_times(self, key):
         return np.concatenate([r.wait_times(key) for r in self.customerLog])
@@ -101,21 +332,15 @@ class Simulation:
     def start_times(self):
         return np.concatenate([c.start_times for c in self.customerLog])
 
-    def average_queue_length(self, resource):
+    def average_queue_length(self, resource, runs=None):
+        if runs is None:
+            runs = range(self.runs)
         numerator = 0
         denominator = 0
-        for run in range(self.runs):
-            if isinstance(self.resourceLog[run][resource],
-                          list):  # if it's a list (meaning we're dealing with checkouts)
-                for res in self.resourceLog[run][resource]:
-                    queue_length, time = res.queue_length()
-                    numerator += np.sum(queue_length[:-1] * np.diff(time))
-                    denominator += max(time)
-            else:
-                res = self.resourceLog[run][resource]
-                queue_length, time = res.queue_length()
-                numerator += np.sum(queue_length[:-1] * np.diff(time))
-                denominator += max(time)
+        for run in runs:
+            queue_integral, duration = queue_length_integral(self.resourceLog[run][resource])
+            numerator += queue_integral
+            denominator += duration
         return numerator / denominator
 
     def __interporale_availability_to_common_time(self, resource, num_points=1000):
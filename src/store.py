@@ -1,10 +1,14 @@
 from matplotlib import pyplot as plt
 import numpy as np
 
+from src.checkout import CheckoutBank
 from src.department import Department
 from src.shelf import Shelf
 from src.pathing import PathGrid
 
+# extent of the layout in pixels of store.PNG and of the store in meters
+LAYOUT_SIZE = np.asarray([2780.0, 1730.0])
+STORE_SIZE = np.asarray([40.0, 30.0])
 
 class Store:
 
@@ -202,6 +206,16 @@ class Store:
         self.path_grid.add_edge(28, 77, departments=["A", "D"])
         self.path_grid.add_edge(29, 77, departments=["D", "E"])
 
+        # checkout lanes, express lanes come after the regular ones
+        quantities = self.config["resource quantities"]
+        regular = quantities.get("checkouts", 4)
+        express = quantities.get("express checkouts", 0)
+        if regular < 1 or express < 0:
+            raise ValueError(f"at least one regular checkout is needed, got {regular} and {express} express checkouts")
+        self.front_aisle = list(range(62, 71))  # nodes of the aisle in front of the checkouts, from left to right
+        self.checkout_row = self.checkout_nodes(max(regular + express, 4))  # lane positions of the checkout row
+        checkout_nodes = self.checkout_row[:regular + express]
+
         self.departments["A"] = Department("A - Fruit & Vegetables", env,
                                            shelves=[Shelf(np.asarray([403.0, 1049.0]), np.asarray([810.0, 1049.0])),
                                                     Shelf(np.asarray([403.0, 1049.0]), np.asarray([403.0, 1282.0])),
@@ -283,7 +297,74 @@ class Store:
                                                     Shelf(np.asarray([2710.0, 479.0]), np.asarray([2710.0, 1048.0])), ])
 
 
-        self.scale(np.asarray([2780.0, 1730.0]), np.asarray([40.0, 30.0]))
+        self.scale(LAYOUT_SIZE, STORE_SIZE)
+
+        nodes = [self.path_grid.nodes[node] for node in checkout_nodes]
+        self.checkouts = CheckoutBank(env, nodes[:regular], nodes[regular:],
+                                      self.config.get("checkout", {}).get("express item limit", 10))
+
+    def checkout_nodes(self, lanes):
+        """
+        nodes of the checkout lanes. up to four lanes use the lanes of the layout, larger banks of lanes get nodes of
+        their own, spread evenly over the checkout row. neighbouring lanes have to be at least twice the customer size
+        apart, a ValueError is raised if the lanes do not fit the row
+        """
+        layout = [71, 72, 73, 74]
+        if lanes <= len(layout):
+            return layout[:lanes]
+        xs = np.linspace(2032.0, 2671.5, lanes)
+        spacing = 2 * self.config["Customer"]["size"]
+        if (xs[1] - xs[0]) * STORE_SIZE[0] / LAYOUT_SIZE[0] < spacing:
+            room = int((xs[-1] - xs[0]) * STORE_SIZE[0] / LAYOUT_SIZE[0] // spacing) + 1
+            raise ValueError(f"{lanes} checkout lanes do not fit the checkout row, it has room for {room} lanes")
+        return [self.add_checkout_node(x) for x in xs]
+
+    def free_checkout_node(self, node_id=None):
+        """
+        node for an extra checkout lane opened during the day. node_id has to be a lane position of the checkout row
+        which is not in use, without it the first free position is taken. if all positions are in use, a new one is
+        added in the middle of the widest gap between neighbouring lanes and the path grid is rebuilt. raises a
+        ValueError if the position is taken or the new lane would be closer than twice the customer size to the others
+        """
+        used = {lane.node.unid for lane in self.checkouts.lanes}
+        if node_id is not None:
+            if node_id not in self.checkout_row or node_id in used:
+                raise ValueError(f"node {node_id} is not a free lane position of the checkout row")
+            return node_id
+        for node in self.checkout_row:
+            if node not in used:
+                return node
+
+        xs = sorted(self.path_grid.nodes[node].pos[0] for node in self.checkout_row)
+        gap, x = max((right - left, (left + right) / 2) for left, right in zip(xs, xs[1:]))
+        if gap / 2 < 2 * self.config["Customer"]["size"]:
+            raise ValueError(f"no room for another checkout lane, all {len(xs)} lane positions are in use")
+        self.checkout_row.append(self.add_checkout_node(x))
+        self.path_grid.build()
+        return self.checkout_row[-1]
+
+    def add_checkout_node(self, x):
+        """
+        node of a generated checkout lane at x on the checkout row, leading to the exit. it is fed from a node of the
+        front aisle right in front of it, which is added to the aisle unless there is one already, so the lines of
+        neighbouring lanes do not run into each other. the feeder is tagged "checkout" instead of a department, so no
+        items are placed on it
+        """
+        nodes = self.path_grid.nodes
+        feeder = min(self.front_aisle, key=lambda node: abs(nodes[node].pos[0] - x))
+        if not np.isclose(nodes[feeder].pos[0], x):
+            i = next(i for i, node in enumerate(self.front_aisle) if nodes[node].pos[0] > x)
+            left, right = self.front_aisle[i - 1], self.front_aisle[i]
+            self.path_grid.add_node(np.asarray([x, nodes[left].pos[1]]))
+            feeder = len(nodes) - 1
+            self.path_grid.add_edge(left, feeder, departments=["G"])
+            self.path_grid.add_edge(feeder, right, departments=["G"])
+            self.front_aisle.insert(i, feeder)
+        self.path_grid.add_node(np.asarray([x, nodes[71].pos[1]]))
+        node = len(nodes) - 1
+        self.path_grid.add_edge(feeder, node, False, departments=["checkout"])
+        self.path_grid.add_edge(node, 75, False)
+        return node
 
     def scale(self, old, new):
         # scale each department using old and new extends of the store
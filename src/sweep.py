@@ -0,0 +1,149 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from copy import deepcopy
+from itertools import product
+import csv
+import os
+
+from src.simulation import Simulation, run_replication
+from src.precision import confidence_interval
+
+
+RESOURCE_KEYS = ("shopping_carts", "baskets", "C", "D", "checkout")
+# (kpi, key) pairs reported for every scenario
+SUMMARY_KPIS = [("store_times", None)] + [("wait_times", key) for key in RESOURCE_KEYS] + \
+               [("average_queue_length", key) for key in RESOURCE_KEYS]
+
+
+def apply_overrides(config, overrides):
+    """
+    return a copy of config with the (nested) values of overrides merged into it
+    """
+    config = deepcopy(config)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            config[key] = apply_overrides(config[key], value)
+        else:
+            config[key] = deepcopy(value)
+    return config
+
+
+def override_grid(values, section="resource quantities"):
+    """
+    full factorial grid of overrides for one config section.
+    e.g. override_grid({"bread clerks": [3, 4], "checkouts": [3, 4]}) gives four scenarios
+    """
+    keys = list(values.keys())
+    return [{section: dict(zip(keys, combination))} for combination in product(*[values[k] for k in keys])]
+
+
+def flatten_overrides(overrides, prefix=""):
+    flat = dict()
+    for key, value in overrides.items():
+        if isinstance(value, dict):
+            flat.update(flatten_overrides(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def run_scenario_jobs(pool, simulations, jobs):
+    """
+    run (scenario index, run index) jobs on the process pool and add the results to the Simulation of each scenario.
+    every job is submitted on its own so the pool stays balanced. results are added in run order, independent of the
+    order the jobs finish in, so the runs of every scenario must continue its logs without gaps
+    """
+    scenarios = sorted({s for s, _ in jobs})
+    for s in scenarios:
+        simulations[s].check_trace_path(len(simulations[s].customerLog) + sum(1 for j, _ in jobs if j == s))
+    if sum(isinstance(simulations[s].config["Customer"]["flags"].get("trace", False), str) for s in scenarios) > 1:
+        # the runs of the scenarios share their seeds and with them the {replication} label of the trace file
+        raise ValueError("the scenarios would write the same trace files, trace one scenario at a time")
+
+    records = dict()
+    futures = dict()
+    for s, run in jobs:
+        cached = simulations[s].load_cached([run])
+        if run in cached:
+            records[(s, run)] = cached[run]
+            continue
+        future = pool.submit(run_replication, simulations[s].config, *simulations[s].replication_arguments(run))
+        futures[future] = (s, run)
+
+    for future in as_completed(futures):
+        s, run = futures[future]
+        records[(s, run)] = future.result()
+        print(f"finished scenario {s} run {run}")
+        if simulations[s].cache is not None:
+            simulations[s].cache.store(simulations[s].cache_path(run), records[(s, run)])
+
+    for s, run in sorted(records.keys()):
+        simulations[s].add_record(records[(s, run)])
+
+
+class ParameterSweep:
+    """
+    runs R replications of every scenario (a dict of config overrides) on a process pool. all (scenario, replication)
+    jobs are scheduled individually so the pool stays balanced even if scenarios differ in run time.
+    by default replication r of every scenario uses the same seed with common random numbers, so differences between
+    scenarios are paired
+    """
+
+    def __init__(self, config, scenarios, replications, workers=None, seed=0, common_random_numbers=True,
+                 antithetic=False, confidence=0.95, cache=None):
+        self.config = config
+        self.scenarios = list(scenarios)
+        self.replications = replications
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.confidence = confidence
+
+        # one (not yet run) Simulation per scenario to collect the results and derive the seeds
+        self.simulations = [Simulation(apply_overrides(config, overrides), runs=0, seed=seed,
+                                       common_random_numbers=common_random_numbers, antithetic=antithetic,
+                                       cache=cache)
+                            for overrides in self.scenarios]
+        if antithetic and replications % 2 != 0:
+            raise ValueError("antithetic replications need an even number of replications")
+
+        self.rows = []
+
+    def run(self):
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            run_scenario_jobs(pool, self.simulations,
+                              [(s, run) for run in range(self.replications) for s in range(len(self.simulations))])
+
+        self.rows = self.table()
+        return self.rows
+
+    def table(self):
+        """
+        tidy result table, one row per scenario and KPI holding the mean and confidence interval half width
+        """
+        rows = []
+        for s, (overrides, simulation) in enumerate(zip(self.scenarios, self.simulations)):
+            for kpi, key in SUMMARY_KPIS:
+                mean, half_width = confidence_interval(simulation.estimation_values(kpi, key), self.confidence)
+                row = {"scenario": s}
+                row.update(flatten_overrides(overrides))
+                row.update({"kpi": kpi, "key": key, "runs": simulation.runs, "mean": mean,
+                            "half_width": half_width})
+                rows.append(row)
+        return rows
+
+    def save_csv(self, path):
+        fields = []
+        for row in self.rows:
+            fields += [field for field in row.keys() if field not in fields]
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+    def print_table(self):
+        print('---------------------------------')
+        for row in self.rows:
+            settings = ", ".join(f"{k}={v}" for k, v in row.items()
+                                 if k not in ("scenario", "kpi", "key", "runs", "mean", "half_width"))
+            label = row["kpi"] if row["key"] is None else f"{row['kpi']}({row['key']})"
+            print("scenario {} [{}] {}: {:.2f} +- {:.2f}".format(row["scenario"], settings, label, row["mean"],
+                                                               row["half_width"]))
+        print('---------------------------------')
@@ -0,0 +1,58 @@
+import json
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+import simpy
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from src.simulation import Simulation, setup_replication  # noqa: E402
+
+
+def kpis(log):
+    # number of customers, total and longest store time and total checkout wait of a replication
+    table = log.customer_table
+    store_times = table.exit[:len(table)] - table.start[:len(table)]
+    checkout_wait = table.wait[:len(table), table.keys["checkout"]]
+    return len(table), float(store_times.sum()), float(store_times.max()), float(np.nansum(checkout_wait))
+
+
+def replication(config, seed, **kwargs):
+    # environment, store, resources and customer factory of the first replication of a seed, not run yet
+    env = simpy.Environment()
+    simulation = Simulation(config, runs=0, seed=seed, **kwargs)
+    return (env,) + setup_replication(env, config, *simulation.replication_arguments(0))
+
+
+def observe(env, customer_factory, interval, check):
+    # call check every interval seconds while customers are still to come or in the store
+    def observer():
+        while customer_factory.customers or customer_factory.next_arrival < len(customer_factory.arrival_table):
+            yield env.timeout(interval)
+            check()
+    env.process(observer())
+
+
+@pytest.fixture
+def config():
+    # the shipped config at a tenth of the arrival rate, without console output or trace
+    with open(ROOT / "config.json") as file:
+        config = json.load(file)
+    for arrival in config["Customer"]["arrivals"]:
+        arrival[1] *= 0.1
+    config["Customer"]["flags"]["print"] = False
+    config["Customer"]["flags"]["trace"] = False
+    return config
+
+
+@pytest.fixture
+def run_day():
+    def run_day(config, seed=0, **kwargs):
+        # kpis of a single replication of the given seed
+        simulation = Simulation(config, runs=1, seed=seed, **kwargs)
+        simulation.run()
+        return kpis(simulation.customerLog[0])
+    return run_day
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from src.branching import add_checkout, add_clerks, run_branches
+from src.simulation import Simulation
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="branches are forked")
+
+
+def test_branches(config):
+    simulation = Simulation(config, runs=1, seed=0)
+    unchanged, checkout, clerks = run_branches(simulation, 4 * 3600, [None, add_checkout(), add_clerks("C", 2)])
+    simulation.run()
+    assert unchanged.customerLog[0].customer_table.exit.tolist() == \
+        simulation.customerLog[0].customer_table.exit.tolist()
+    assert len(checkout.resourceLog[0]["checkout"]) == 5
+    assert len(clerks.customerLog[0].customer_table) == len(simulation.customerLog[0].customer_table)
+    assert clerks.departmentLog[0]["C"].queue.capacity == config["resource quantities"]["bread clerks"] + 2
+    before, after = (log["C"].queue for log in (simulation.departmentLog[0], clerks.departmentLog[0]))
+    available, time = after.availability()
+    expected, expected_time = before.availability()
+    assert available[time < 4 * 3600].tolist() == expected[expected_time < 4 * 3600].tolist()
+    assert after.capacity_log[-1] == (4 * 3600, after.capacity)
+
+
+def test_extra_checkout_needs_a_free_position(config):
+    with pytest.raises(RuntimeError, match="ValueError: node 71 is not a free lane position"):
+        run_branches(Simulation(config, runs=1, seed=0), 3600, [add_checkout(71)])
+    config["resource quantities"]["checkouts"] = 10  # the row is full
+    with pytest.raises(RuntimeError, match="ValueError: no room for another checkout lane"):
+        run_branches(Simulation(config, runs=1, seed=0), 3600, [add_checkout()])
+
+
+def test_failing_change_reports_its_traceback(config):
+    def change(env, store, resources, customer_factory):
+        raise KeyError("no such department")
+
+    with pytest.raises(RuntimeError, match="KeyError: 'no such department'"):
+        run_branches(Simulation(config, runs=1, seed=0), 3600, [None, change])
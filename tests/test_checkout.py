@@ -0,0 +1,91 @@
+import math
+
+import numpy as np
+import pytest
+import simpy
+
+from conftest import observe, replication
+from src.checkout import CheckoutBank, LoadTree
+from src.store import Store
+
+
+def test_load_tree_matches_a_scan():
+    rng = np.random.default_rng(0)
+    tree = LoadTree()
+    values = []
+    assert tree.min() == (math.inf, math.inf)
+    for _ in range(2000):
+        if rng.uniform() < 0.1 or not values:
+            values.append((int(rng.integers(5)), len(values)))
+            assert tree.append(values[-1]) == len(values) - 1
+        else:
+            position = int(rng.integers(len(values)))
+            values[position] = (int(rng.integers(5)), position)
+            tree.update(position, values[position])
+        assert tree.min() == min(values)
+
+
+def test_customers_take_the_least_loaded_lane_they_may_use():
+    env = simpy.Environment()
+    bank = CheckoutBank(env, [None, None], express_nodes=[None], express_items=10)
+    regular, other, express = bank.lanes
+    assert bank.choose(30) is regular  # ties go to the first lane
+    requests = [regular.request(), other.request()]
+    assert bank.choose(5) is express and bank.choose(30) is regular
+    express.request()
+    assert bank.choose(5) is regular
+    regular.release(requests[0])
+    env.run()
+    assert bank.choose(30) is regular and bank.loads == [0, 1, 1]
+    statistics = bank.statistics()
+    assert statistics["lanes"] == 3 and statistics["express lanes"] == 1 and statistics["served"] == [1, 0, 0]
+
+
+def test_express_lanes_only_serve_small_baskets():
+    bank = CheckoutBank(simpy.Environment(), [], express_nodes=[None], express_items=10)
+    assert bank.choose(10) is bank.lanes[0]
+    with pytest.raises(ValueError):
+        bank.choose(11)
+
+
+def test_generated_checkout_row_is_kept_apart_from_the_shelves(config):
+    config["resource quantities"]["checkouts"] = 10
+    store = Store(simpy.Environment(), config)
+    assert len(store.checkouts.lanes) == 10
+    feeders = store.path_grid.sorted_edges["checkout"]
+    assert len(feeders) == 10
+    assert not set(feeders) & set(store.path_grid.sorted_edges["G"])
+    # every lane is fed straight from a front aisle node of its own, the lanes are two customers apart
+    assert len({edge.start.unid for edge in feeders}) == 10
+    assert all(edge.vec[0] == pytest.approx(0.0) for edge in feeders)
+    assert np.diff(sorted(lane.node.pos[0] for lane in store.checkouts.lanes)).min() >= 2 * config["Customer"]["size"]
+
+
+def test_checkout_row_has_room_for_ten_lanes(config):
+    config["resource quantities"]["checkouts"] = 11
+    with pytest.raises(ValueError, match="11 checkout lanes do not fit the checkout row, it has room for 10 lanes"):
+        Store(simpy.Environment(), config)
+
+
+@pytest.mark.parametrize("checkouts, express", [(1, 1), (6, 0)])
+def test_day_at_the_checkouts(config, checkouts, express):
+    # a regular and an express lane, and a generated row of six lanes. the shopping lists hold 40 items and more,
+    # the express lane takes the smaller ones when the regular lane is busy
+    config["resource quantities"]["checkouts"] = checkouts
+    config["resource quantities"]["express checkouts"] = express
+    config["checkout"]["express item limit"] = 60
+    env, store, resources, customer_factory = replication(config, 8)
+    bank = store.checkouts
+
+    def check():
+        assert bank.loads == [lane.load for lane in bank.lanes]
+        assert bank.choose(61).load == min(lane.load for lane in bank.lanes if not lane.express)
+        for lane in bank.lanes:
+            if lane.express:
+                assert all(customer.total_items <= 60 for customer in lane.customer_queue)
+
+    observe(env, customer_factory, 10, check)
+    env.run()
+    served = bank.statistics()["served"]
+    assert sum(served) == len(customer_factory.customer_table)
+    assert served[0] > 0 and all(served[lane.index] > 0 for lane in bank.lanes if lane.express)
@@ -0,0 +1,39 @@
+import copy
+
+import numpy as np
+import simpy
+
+from src.simulation import Simulation, setup_replication
+
+
+def test_walking_customers_stay_on_the_grid(config):
+    env = simpy.Environment()
+    simulation = Simulation(config, runs=0, seed=2)
+    store, resources, customer_factory = setup_replication(env, config, *simulation.replication_arguments(0))
+    nodes = np.asarray([node.pos for node in store.path_grid.nodes])
+    low, high = nodes.min(axis=0) - 1e-9, nodes.max(axis=0) + 1e-9
+    positions = []
+
+    def observe():
+        # positions of walking customers are evaluated lazily from their current walk
+        while True:
+            yield env.timeout(7.0)
+            positions.extend(customer.pos for customer in customer_factory.customers.values() if customer.walking)
+
+    env.process(observe())
+    env.run(until=6 * 3600)
+    assert len(positions) > 100
+    assert np.all((np.asarray(positions) >= low) & (np.asarray(positions) <= high))
+
+
+def test_congestion_routing_only_changes_the_walks(config):
+    # with common random numbers the same customers arrive and draw the same service, scan and payment times
+    uses = []
+    for congestion_routing in (False, True):
+        config["Customer"]["congestion_routing"] = congestion_routing
+        simulation = Simulation(copy.deepcopy(config), runs=1, seed=2, common_random_numbers=True)
+        simulation.run()
+        table = simulation.customerLog[0].customer_table
+        columns = [table.keys[key] for key in ("C", "D", "checkout")]
+        uses.append(table.use[:len(table)][np.argsort(table.ucid[:len(table)])][:, columns])
+    assert np.array_equal(*uses, equal_nan=True)
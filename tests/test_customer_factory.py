@@ -0,0 +1,44 @@
+import copy
+
+import numpy as np
+
+from conftest import replication
+
+
+def test_customers_are_created_on_arrival(config):
+    env, store, resources, customer_factory = replication(config, 4)
+    assert not customer_factory.customers
+    for hour in range(1, 13):
+        env.run(until=hour * 3600)
+        arrived = customer_factory.arrival_table.times <= env.now
+        assert customer_factory.next_arrival == np.count_nonzero(arrived)
+        assert len(customer_factory.customers) + len(customer_factory.customer_table) == customer_factory.next_arrival
+    env.run()
+    assert len(customer_factory.customer_table) == len(customer_factory.arrival_table)
+
+
+def test_thinning_only_removes_pending_arrivals(config):
+    env, store, resources, customer_factory = replication(config, 4)
+    env.run(until=4 * 3600)
+    arrived = customer_factory.next_arrival
+    pending = len(customer_factory.arrival_table) - arrived
+    customer_factory.scale_arrivals(0.5)
+    assert len(customer_factory.arrival_table) < pending
+    assert np.all(customer_factory.arrival_table.times >= env.now)
+    env.run()
+    assert len(customer_factory.customer_table) == arrived + len(customer_factory.arrival_table)
+
+
+def test_more_arrivals_only_change_the_arrivals_to_come(config):
+    # scaling the arrivals after four hours leaves the customers who came before alone and brings more afterwards
+    starts = []
+    for scale in (1.0, 1.5):
+        env, store, resources, customer_factory = replication(copy.deepcopy(config), 4)
+        env.run(until=4 * 3600)
+        customer_factory.scale_arrivals(scale)
+        env.run()
+        table = customer_factory.customer_table
+        starts.append(np.sort(table.start[:len(table)]))
+    early = [start[start < 4 * 3600] for start in starts]
+    assert np.array_equal(*early)
+    assert len(starts[1]) - len(early[1]) > len(starts[0]) - len(early[0])
@@ -0,0 +1,55 @@
+import copy
+import os
+
+import pytest
+
+import src.distributed as distributed
+from conftest import kpis
+from src.simulation import Simulation
+
+
+@pytest.fixture
+def coordinator(tmp_path):
+    coordinator = distributed.Coordinator(tmp_path, timeout=5.0, poll_interval=0.05)
+    yield coordinator
+    coordinator.shutdown()
+
+
+def run_with_worker(coordinator, simulations):
+    worker = distributed.start_local_workers(coordinator.queue.root, 1, poll_interval=0.05)[0]
+    try:
+        return coordinator.run(simulations)
+    finally:
+        coordinator.shutdown()
+        worker.join()
+
+
+def test_results_equal_local_runs(config, coordinator):
+    local = Simulation(copy.deepcopy(config), runs=2, seed=1)
+    local.run()
+    simulation, = run_with_worker(coordinator, [Simulation(copy.deepcopy(config), runs=2, seed=1)])
+    assert [kpis(log) for log in simulation.customerLog] == [kpis(log) for log in local.customerLog]
+    assert not any(os.listdir(directory) for directory in (coordinator.queue.pending, coordinator.queue.claimed,
+                                                           coordinator.queue.done))
+
+
+def test_failed_job_is_raised(config, coordinator):
+    config["resource quantities"]["checkouts"] = 0  # the store can not be built
+    with pytest.raises(RuntimeError, match="ValueError: at least one regular checkout is needed"):
+        run_with_worker(coordinator, [Simulation(config, runs=1)])
+
+
+def test_lost_job_is_given_up(config, tmp_path):
+    coordinator = distributed.Coordinator(tmp_path, timeout=0.0, max_reassignments=2)
+    jobs = coordinator.submit(Simulation(config, runs=0), [0])
+    name, = jobs
+    with pytest.raises(RuntimeError, match="lost 3 times"):
+        for _ in range(3):
+            os.rename(coordinator.queue.pending / name, coordinator.queue.claimed / name)
+            coordinator.reassign_lost(jobs)
+
+
+def test_jobs_of_other_submissions_are_ignored(config, tmp_path):
+    coordinator = distributed.Coordinator(tmp_path)
+    simulation = Simulation(config, runs=0)
+    assert set(coordinator.submit(simulation, [0, 1])).isdisjoint(coordinator.submit(simulation, [0, 1]))
@@ -0,0 +1,90 @@
+import simpy
+
+from conftest import replication
+from src.edge_reservations import EdgeReservations
+
+
+class Edge:
+    def __init__(self, name):
+        self.name = name
+
+
+class Customer:
+    def __init__(self, ucid):
+        self.ucid = ucid
+
+
+def customers(count):
+    return [Customer(ucid) for ucid in range(count)]
+
+
+def test_edge_is_handed_on_in_order_of_requests():
+    env = simpy.Environment()
+    reservations = EdgeReservations(env)
+    edge = Edge("1-2")
+    reservations.add(edge)
+    first, second, third = customers(3)
+
+    assert reservations.reserve(edge, first) is None
+    waiting = [reservations.reserve(edge, second), reservations.reserve(edge, third)]
+    assert reservations.occupied(edge) and reservations.load(edge) == 3
+    assert not any(event.triggered for event in waiting)
+
+    reservations.release(edge, first)
+    assert waiting[0].triggered and not waiting[1].triggered
+    assert reservations.holder[edge] is second
+    reservations.release(edge, second)
+    assert waiting[1].triggered
+    reservations.release(edge, third)
+    assert not reservations.occupied(edge) and reservations.load(edge) == 0
+
+
+def test_waiting_customer_can_withdraw():
+    env = simpy.Environment()
+    reservations = EdgeReservations(env)
+    edge = Edge("1-2")
+    reservations.add(edge)
+    first, second, third = customers(3)
+
+    reservations.reserve(edge, first)
+    reservations.reserve(edge, second)
+    event = reservations.reserve(edge, third)
+    reservations.release(edge, second)  # interrupted while waiting
+    reservations.release(edge, first)
+    assert event.triggered and reservations.holder[edge] is third
+
+
+def test_statistics():
+    env = simpy.Environment()
+    reservations = EdgeReservations(env)
+    edge = Edge("1-2")
+    reservations.add(edge)
+    first, second = customers(2)
+
+    def walk(customer, start, duration):
+        yield env.timeout(start)
+        event = reservations.reserve(edge, customer)
+        if event is not None:
+            yield event
+        yield env.timeout(duration)
+        reservations.release(edge, customer)
+
+    env.process(walk(first, 0.0, 4.0))
+    env.process(walk(second, 1.0, 2.0))
+    env.run()
+    assert reservations.timeline[edge] == [[0.0, 4.0, 0], [4.0, 6.0, 1]]
+    assert reservations.statistics() == {"1-2": {"traversals": 2, "blocked": 1, "wait_time": 3.0,
+                                                 "occupied_time": 6.0, "queue_integral": 3.0}}
+
+
+def test_day_with_carts_only(config):
+    # every customer takes a cart and reserves the narrow aisles
+    config["Customer"]["basket"] = 0.0
+    env, store, resources, customer_factory = replication(config, 3)
+    env.run()
+    reservations = store.path_grid.reservations
+    assert not any(reservations.holder.values()) and not any(reservations.waiting.values())
+    assert sum(reservations.traversals.values()) > 0
+    for timeline in reservations.timeline.values():
+        assert all(end is not None for _, end, _ in timeline)
+        assert all(later[0] >= earlier[1] for earlier, later in zip(timeline, timeline[1:]))
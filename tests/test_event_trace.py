@@ -0,0 +1,63 @@
+import numpy as np
+
+from src.event_trace import CHECKOUT, ENTER, PAY, PICKED, EventTracer, read_trace, render
+
+DEPARTMENTS = {"A": "Fruits", "C": "Bread"}
+
+
+def record(tracer, count):
+    for k in range(count):
+        tracer.record(float(k), k % 3, ENTER if k % 2 else PICKED, b"A", x=k, y=-k, u=2 * k, v=0.5)
+
+
+def test_stream_round_trip(tmp_path):
+    path = tmp_path / "trace.npy"
+    tracer = EventTracer(DEPARTMENTS, capacity=4, path=path)
+    record(tracer, 10)
+    tracer.close()
+    departments, events = read_trace(path)
+    assert departments == DEPARTMENTS
+    assert len(events) == 10
+    assert list(events["time"]) == [float(k) for k in range(10)]
+    assert list(events["u"]) == [2.0 * k for k in range(10)]
+    assert set(events["department"]) == {b"A"}
+
+
+def test_ring_keeps_the_latest_events():
+    tracer = EventTracer(DEPARTMENTS, capacity=4)
+    record(tracer, 10)
+    assert list(tracer.events()["time"]) == [6.0, 7.0, 8.0, 9.0]
+    assert tracer.recorded == 10
+
+
+def test_render():
+    tracer = EventTracer(DEPARTMENTS, capacity=8)
+    tracer.record(1.0, 7, ENTER, b"C")
+    tracer.record(2.5, 7, PICKED, b"C", u=3, v=12.25)
+    tracer.record(3.0, 8, CHECKOUT, u=1)
+    tracer.record(4.0, 7, PAY)
+    assert list(render(tracer.events(), DEPARTMENTS)) == ["1.00: 7 enters department Bread",
+                                                          "2.50: 7 picked 3 items at department C in 12.25 seconds",
+                                                          "3.00: 8 enters checkout", "4.00: 7 pays at checkout"]
+    assert list(render(tracer.events(), DEPARTMENTS, ucids=[8])) == ["3.00: 8 enters checkout"]
+
+
+def test_printed_events_are_live(capsys, tmp_path):
+    tracer = EventTracer(DEPARTMENTS, capacity=4, path=tmp_path / "trace.npy", echo=True)
+    record(tracer, 1)
+    assert capsys.readouterr().out == "0.00: 0 picked 0 items at department A in 0.50 seconds\n"
+    record(tracer, 5)
+    assert len(capsys.readouterr().out.splitlines()) == 5
+    assert tracer.size == 2  # the file is still written in chunks
+    tracer.close()
+    assert capsys.readouterr().out == ""
+    assert len(read_trace(tmp_path / "trace.npy")[1]) == 6
+
+
+def test_traced_day_equals_untraced_day(config, run_day, tmp_path):
+    untraced = run_day(config, seed=9)
+    config["Customer"]["flags"]["trace"] = str(tmp_path / "trace-{replication}.npy")
+    assert run_day(config, seed=9) == untraced
+    departments, events = read_trace(tmp_path / "trace-0.npy")
+    assert len(np.unique(events["ucid"])) == untraced[0]
+    assert np.count_nonzero(events["code"] == PAY) == untraced[0]
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from conftest import observe, replication
+from src.indexed_queue import IndexedQueue
+
+
+def test_matches_a_list():
+    rng = np.random.default_rng(0)
+    queue = IndexedQueue()
+    reference = []
+    item = 0
+    for _ in range(5000):
+        action = rng.uniform()
+        if action < 0.5 or not reference:
+            queue.append(item)
+            reference.append(item)
+            item += 1
+        elif action < 0.8:
+            removed = reference[rng.integers(len(reference))]
+            queue.remove(removed)
+            reference.remove(removed)
+        else:
+            assert queue.pop(0) == reference.pop(0)
+        assert len(queue) == len(reference)
+        if reference:
+            probe = reference[rng.integers(len(reference))]
+            position = reference.index(probe)
+            assert queue.index(probe) == position
+            assert queue.ahead(probe) == (reference[position - 1] if position > 0 else None)
+            assert queue.behind(probe) == (reference[position + 1] if position + 1 < len(reference) else None)
+            assert queue[0] == reference[0] and queue[-1] == reference[-1]
+    assert list(queue) == reference
+
+
+def test_tree_stays_small_when_the_queue_never_empties():
+    queue = IndexedQueue()
+    for item in range(3):
+        queue.append(item)
+    for item in range(3, 10000):
+        queue.append(item)
+        assert queue.pop(0) == item - 3
+        assert [queue.index(queued) for queued in queue] == [0, 1, 2]
+    assert len(queue.tree) == 65 and queue.appended < 65
+    assert list(queue) == [9997, 9998, 9999]
+
+
+def test_errors():
+    queue = IndexedQueue()
+    queue.append("a")
+    with pytest.raises(ValueError):
+        queue.remove("b")
+    with pytest.raises(ValueError):
+        queue.index("b")
+    with pytest.raises(IndexError):
+        queue[1]
+    assert "a" in queue and "b" not in queue
+
+
+def test_day_with_two_checkouts(config):
+    # long checkout queues, the positions of the queued customers follow their order in the queue
+    config["resource quantities"]["checkouts"] = 2
+    env, store, resources, customer_factory = replication(config, 7)
+    lanes = store.checkouts.lanes
+
+    def check():
+        for lane in lanes:
+            assert [lane.position(c) for c in lane.customer_queue] == list(range(len(lane.customer_queue)))
+            assert len(lane.customer_queue) == lane.count + len(lane.put_queue)
+
+    observe(env, customer_factory, 10, check)
+    env.run()
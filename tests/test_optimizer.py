@@ -0,0 +1,27 @@
+from src.optimizer import Constraint, ResourceOptimizer
+
+# checkout waits of the tenth load day: about 50 s with a single checkout, about 20 s with three or more
+CHECKOUT_WAIT = Constraint("wait_times", "checkout", limit=30.0, tolerance=10.0)
+
+
+def test_selects_the_cheapest_feasible_configuration(config):
+    optimizer = ResourceOptimizer(config, [{"checkouts": 5}, {"checkouts": 1}, {"checkouts": 3}], {"checkouts": 1.0},
+                                  [CHECKOUT_WAIT], initial_replications=4, batch_size=2, max_replications=12,
+                                  workers=1)
+    result = optimizer.run()
+    assert result["selected"] == {"checkouts": 3} and result["cost"] == 3.0 and result["guaranteed"]
+    assert optimizer.decisions == [[False], [True], [True]]  # candidates from cheap to expensive
+    # the single checkout needs more than the first stage to be shown infeasible, the five checkouts are dominated
+    # by the three as soon as those are feasible and get no further runs
+    assert result["runs"][0] > 4 and result["runs"][1:] == [4, 4]
+    assert result["estimates"]["wait_times(checkout)"] < 30.0
+
+
+def test_no_guarantee_when_the_budget_runs_out(config):
+    # the limit is within the noise of the waits, the constraint can not be decided in three runs
+    constraint = Constraint("wait_times", "checkout", limit=19.5, tolerance=0.1)
+    optimizer = ResourceOptimizer(config, [{"checkouts": 3}], {"checkouts": 1.0}, [constraint],
+                                  initial_replications=3, max_replications=3, workers=1)
+    result = optimizer.run()
+    assert optimizer.decisions == [[None]]
+    assert result["selected"] == {"checkouts": 3} and not result["guaranteed"] and result["runs"] == [3]
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+import simpy
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path
+
+from src.store import Store
+
+
+def path_length(grid, start, path, goal):
+    # length of a path from start to goal through the given nodes, start and goal are node ids or positions
+    points = [grid.nodes[start].pos if isinstance(start, int) else start]
+    points += [grid.nodes[node].pos for node in path if node < len(grid.nodes)]
+    points.append(grid.nodes[goal].pos if isinstance(goal, int) else goal)
+    return np.linalg.norm(np.diff(points, axis=0), axis=1).sum()
+
+
+def random_position(grid, dep, rng):
+    edges = grid.sorted_edges[dep]
+    edge = edges[rng.integers(len(edges))]
+    return edge.start.pos + rng.uniform(0.05, 0.95) * edge.vec
+
+
+@pytest.fixture
+def store(config):
+    return Store(simpy.Environment(), config)
+
+
+@pytest.fixture
+def distances(store):
+    grid = store.path_grid
+    return shortest_path(csr_matrix((grid.weights, grid.indices, grid.indptr), shape=(len(grid.nodes),) * 2))
+
+
+def test_dijkstra_finds_shortest_paths_between_nodes(store, distances):
+    grid = store.path_grid
+    for start in range(len(grid.nodes)):
+        for goal in range(len(grid.nodes)):
+            if start == goal or np.isinf(distances[start, goal]):
+                continue
+            path = grid.dijkstra(start, goal, None, None)
+            assert path[-1] == goal
+            assert path_length(grid, start, path, goal) == pytest.approx(distances[start, goal], rel=1e-12)
+
+
+def test_dijkstra_finds_shortest_paths_between_positions(store, distances):
+    grid = store.path_grid
+    rng = np.random.default_rng(0)
+    departments = list(grid.sorted_edges)
+    for _ in range(500):
+        dep_0, dep_1 = departments[rng.integers(len(departments))], departments[rng.integers(len(departments))]
+        start, goal = random_position(grid, dep_0, rng), random_position(grid, dep_1, rng)
+        start_links = grid.attach(grid.get_closest_edge(start, dep_0), start)
+        goal_links = grid.attach(grid.get_closest_edge(goal, dep_1), goal)
+        shortest = min(a + distances[i, j] + b for i, a in start_links for j, b in goal_links)
+        path = grid.dijkstra(start, goal, dep_0, dep_1)
+        if path == [None]:
+            continue  # start and goal on the same edge
+        assert path_length(grid, start, path, goal) == pytest.approx(shortest, rel=1e-12)
+
+
+def test_route_finds_shortest_paths_between_nodes(store, distances):
+    grid = store.path_grid
+    for start in range(len(grid.nodes)):
+        for goal in range(len(grid.nodes)):
+            if start == goal or np.isinf(distances[start, goal]):
+                continue
+            path = grid.route(start, goal, None, None)
+            assert path[-1] == goal
+            assert path_length(grid, start, path, goal) == pytest.approx(distances[start, goal], rel=1e-12)
+
+
+def test_route_finds_shortest_paths_between_locations(store, distances):
+    grid = store.path_grid
+    rng = np.random.default_rng(2)
+    departments = list(grid.sorted_edges)
+    for _ in range(500):
+        dep_0, dep_1 = departments[rng.integers(len(departments))], departments[rng.integers(len(departments))]
+        start = grid.locate(random_position(grid, dep_0, rng), dep_0)
+        goal = grid.locate(random_position(grid, dep_1, rng), dep_1)
+        if start.edge == goal.edge:
+            continue
+        shortest = min(a + distances[i, j] + b for i, a in start.links for j, b in goal.links)
+        path = grid.route(start, goal, dep_0, dep_1)
+        assert path[-1] == len(grid.nodes) + 1  # virtual goal node
+        assert path_length(grid, start.pos, path, goal.pos) == pytest.approx(shortest, rel=1e-12)
+        # a plain position routes the same as its Location
+        assert grid.route(start.pos, goal, dep_0, dep_1) == path
+
+
+def test_route_on_a_single_edge(store):
+    grid = store.path_grid
+    dep = next(iter(grid.sorted_edges))
+    edge = grid.sorted_edges[dep][0]
+    start, goal = (grid.locate(edge.start.pos + t * edge.vec, dep) for t in (0.2, 0.7))
+    assert start.edge == goal.edge == edge
+    assert grid.route(start, goal, dep, dep) == [None]
+    assert grid.route(start.pos, goal.pos, dep, dep) == [None]
+
+
+def distance(point, edge):
+    # distance of a point to the segment of an edge
+    t = np.clip(np.dot(point - edge.start.pos, edge.vec) / edge.length ** 2, 0.0, 1.0)
+    return np.linalg.norm(point - (edge.start.pos + t * edge.vec))
+
+
+def test_closest_edge_matches_a_search_over_all_edges(store):
+    points = np.random.default_rng(0).uniform((-2.0, -2.0), (42.0, 32.0), (200, 2))
+    for dep, index in store.path_grid.edge_index.items():
+        for point in points:
+            closest = store.path_grid.get_closest_edge(point, dep)
+            assert distance(point, closest) == pytest.approx(min(distance(point, edge) for edge in index.edges),
+                                                             abs=1e-9)
+
+
+def test_closest_edges_match_single_queries(store):
+    points = np.random.default_rng(1).uniform((0.0, 0.0), (40.0, 30.0), (200, 2))
+    for dep in store.path_grid.edge_index:
+        assert store.path_grid.get_closest_edges(points, dep) == [store.path_grid.get_closest_edge(point, dep)
+                                                                  for point in points]
@@ -0,0 +1,61 @@
+import copy
+
+import numpy as np
+import pytest
+from scipy import stats
+
+from src.precision import PrecisionTarget, confidence_interval
+from src.simulation import Simulation
+
+
+@pytest.fixture
+def store_times(config):
+    # mean store time of the first four runs of seed 0
+    reference = Simulation(copy.deepcopy(config), runs=4, seed=0)
+    reference.run()
+    return reference.estimation_values("store_times")
+
+
+def test_confidence_interval_matches_scipy():
+    samples = [3.0, 5.0, 4.0, np.nan, 8.0]
+    low, high = stats.t.interval(0.9, 3, loc=5.0, scale=stats.sem([3.0, 5.0, 4.0, 8.0]))
+    assert confidence_interval(samples, 0.9) == pytest.approx((5.0, (high - low) / 2))
+    assert confidence_interval([5.0]) == (5.0, np.inf)
+
+
+def test_target_criteria():
+    values = [9.0, 10.0, 11.0]  # mean 10, half width 2.48
+    assert PrecisionTarget("store_times", half_width=2.5).is_met(values)
+    assert not PrecisionTarget("store_times", half_width=2.4).is_met(values)
+    assert PrecisionTarget("store_times", relative_error=0.25).is_met(values)
+    assert not PrecisionTarget("store_times", half_width=2.5, relative_error=0.2).is_met(values)
+    assert not PrecisionTarget("store_times", half_width=100.0).is_met([10.0])
+    with pytest.raises(ValueError):
+        PrecisionTarget("store_times")
+
+
+def test_stops_once_the_target_is_met(config, store_times):
+    widths = [confidence_interval(store_times[:runs])[1] for runs in (2, 4)]
+    assert widths[0] > widths[1]  # the target is missed after the first batch
+    simulation = Simulation(config, runs=0, seed=0)
+    result = simulation.run_until_precision([PrecisionTarget("store_times", half_width=widths[1])], batch_size=2)
+    assert result["converged"] and result["reason"] == "precision reached"
+    assert result["runs"] == simulation.runs == len(simulation.customerLog) == 4
+    assert result["estimates"]["store_times"] == pytest.approx(confidence_interval(store_times[:4]))
+
+
+def test_replication_budget(config, store_times):
+    simulation = Simulation(config, runs=0, seed=0)
+    result = simulation.run_until_precision([PrecisionTarget("store_times", half_width=1e-9)], batch_size=2,
+                                            max_runs=3)
+    assert not result["converged"] and result["reason"] == "replication budget exhausted"
+    assert result["runs"] == len(simulation.customerLog) == 3
+    assert simulation.estimation_values("store_times").tolist() == store_times[:3].tolist()
+
+
+def test_time_budget_reuses_the_runs_made(config):
+    simulation = Simulation(config, runs=2, seed=0)
+    simulation.run()
+    result = simulation.run_until_precision([PrecisionTarget("store_times", half_width=1e-9)], max_time=0)
+    assert not result["converged"] and result["reason"] == "time budget exhausted"
+    assert result["runs"] == len(simulation.customerLog) == 2
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+import simpy
+
+from conftest import observe, replication
+from src.queue_line import QueueLine
+from src.store import Store
+from src.TracedResource import TracedResource
+
+
+class Customer:
+    def __init__(self):
+        self.request = None
+        self.steps = []
+
+    def step_to(self, destination):
+        self.steps.append(destination)
+
+
+@pytest.fixture
+def line(config):
+    env = simpy.Environment()
+    store = Store(env, config)
+    resource = TracedResource(env, capacity=1, name="Checkout", accociated_node=store.path_grid.nodes[71])
+    return env, resource, QueueLine(resource, store.path_grid, 0.5)
+
+
+def test_slots_run_backwards_along_the_lane(line):
+    env, resource, queue_line = line
+    slots = queue_line.slots(np.arange(200))
+    assert np.array_equal(slots[0], resource.node.pos)
+    # consecutive slots are one spacing apart along the lane, corners cut the straight distance short
+    gaps = np.linalg.norm(np.diff(slots, axis=0), axis=1)
+    assert np.all(gaps <= 0.5 + 1e-9)
+    assert np.count_nonzero(np.isclose(gaps, 0.5)) >= len(gaps) - len(queue_line.directions)
+    # past the end of the lane the line goes on along its last segment
+    assert np.allclose(np.diff(slots[-3:], axis=0), 0.5 * queue_line.directions[-1])
+
+
+def test_line_moves_up_when_the_head_is_served(line):
+    env, resource, queue_line = line
+    customers = [Customer() for _ in range(3)]
+    for customer in customers:
+        customer.request = resource.request(customer)
+    env.run()
+    assert customers[0].request.triggered and not customers[1].request.triggered
+    assert np.array_equal(queue_line.join(customers[2]), queue_line.slots([2])[0])
+    for customer in customers[1:]:
+        queue_line.arrive(customer)
+    assert np.array_equal(customers[2].steps[-1], queue_line.slots([2])[0])
+
+    resource.release(customers[0].request, customers[0])
+    env.run()
+    assert customers[1].request.triggered and list(queue_line.standing) == [customers[2]]
+    assert np.array_equal(customers[2].steps[-1], queue_line.slots([1])[0])
+
+
+def test_day_with_long_lines(config):
+    # a single clerk at bread and cheese, the customers standing in line never share a slot
+    config["resource quantities"]["bread clerks"] = 1
+    config["resource quantities"]["cheese clerks"] = 1
+    env, store, resources, customer_factory = replication(config, 6)
+    lines = [store.departments[key].queue.line for key in ("C", "D")]
+    longest = []
+
+    def check():
+        for line in lines:
+            slots = [line.slot(customer) for customer in line.standing]
+            assert len(set(slots)) == len(slots) and all(slot >= 1 for slot in slots)
+            longest.append(len(slots))
+
+    observe(env, customer_factory, 1, check)
+    env.run()
+    assert max(longest) >= 2
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from scipy.stats import truncnorm
+
+from src.random_streams import PhiloxBlocks, RandomStreams, TruncatedNormal, stream_counter
+
+KEY = np.random.SeedSequence(0).generate_state(2, np.uint64)
+
+
+def test_substreams_do_not_depend_on_other_draws():
+    first = RandomStreams(root=KEY, key=(7,))
+    first["scan"].random(1000)
+    second = RandomStreams(root=KEY, key=(7,))
+    assert np.array_equal(first["search"].random(5), second["search"].random(5))
+    assert np.array_equal(RandomStreams(root=KEY, key=(7,))["scan"].random(5),
+                          RandomStreams(root=KEY, key=(7,))["scan"].random(5))
+
+
+def test_substreams_differ_by_source_and_key():
+    draws = [RandomStreams(root=KEY, key=key)[source].random(3)
+             for key in [(), (7,), (8,), (7, 0), (0, 7)] for source in ("scan", "search")]
+    assert len({tuple(values) for values in draws}) == len(draws)
+    with pytest.raises(ValueError):
+        RandomStreams(root=KEY, key=(1, 2, 3))["scan"]
+
+
+def test_antithetic_substreams_are_mirrored():
+    plain = RandomStreams(root=KEY, key=(7,), antithetic=False)
+    mirrored = RandomStreams(root=KEY, key=(7,), antithetic=True)
+    assert np.allclose(plain["scan"].random(5) + mirrored["scan"].random(5), 1.0)
+    assert np.array_equal(plain["basket"].random(5), mirrored["basket"].random(5))  # not an antithetic source
+
+
+def test_truncated_normal_matches_scipy():
+    q = np.linspace(0.0, 1.0, 101)
+    assert np.allclose(TruncatedNormal(-4, 4, loc=120, scale=12).ppf(q), truncnorm.ppf(q, -4, 4, loc=120, scale=12),
+                       rtol=0.0, atol=1e-9)
+    values = RandomStreams(root=KEY, key=(7,)).sample("service_C", TruncatedNormal(-4, 4, loc=120, scale=12), 10000)
+    assert values.min() >= 120 - 4 * 12 and values.max() <= 120 + 4 * 12
+    assert values.mean() == pytest.approx(120, abs=0.5)
+
+
+def test_blocks_continue_the_philox_substream():
+    counter = stream_counter("scan", 7)
+    expected = np.random.Generator(np.random.Philox(key=KEY, counter=counter)).random(50)
+    streams = RandomStreams(root=KEY, key=(7,))
+    drawn = [streams["scan"].random(3), [streams["scan"].random()], streams["scan"].random(40),
+             streams["scan"].random(6)]
+    assert np.array_equal(np.concatenate(drawn), expected)
+    assert np.array_equal(PhiloxBlocks(KEY).draw(counter, 50), expected)
+
+
+def test_variates_are_taken_from_blocks():
+    dist = TruncatedNormal(-4, 4, loc=120, scale=12)
+    streams = RandomStreams(root=KEY, key=(7,))
+    single = [streams.sample("service_C", dist) for _ in range(20)]
+    assert np.array_equal(single, RandomStreams(root=KEY, key=(7,)).sample("service_C", dist, 20))
+    assert np.array_equal(single, dist.ppf(RandomStreams(root=KEY, key=(7,))["service_C"].random(20)))
+
+
+def test_shared_sources_take_blocks_in_turn():
+    sources = ("search", "scan", "service_C")
+    stream = np.random.Generator(np.random.Philox(key=KEY, counter=stream_counter("", 7))).random(30 * 16)
+    blocks = stream.reshape(10, 3, 16)  # block, source, number
+    streams = RandomStreams(root=KEY, key=(7,), sources=sources)
+    assert np.array_equal(streams["search"].random(100), blocks[:7, 0].ravel()[:100])
+    assert np.array_equal(streams["service_C"].random(40), blocks[:3, 2].ravel()[:40])
+    assert np.array_equal(RandomStreams(root=KEY, key=(7,), sources=sources)["service_C"].random(40),
+                          blocks[:3, 2].ravel()[:40])
+    mirrored = RandomStreams(root=KEY, key=(7,), antithetic=True, sources=sources)
+    assert np.array_equal(mirrored["scan"].random(20), 1.0 - blocks[:2, 1].ravel()[:20])
@@ -0,0 +1,76 @@
+import copy
+import os
+
+import numpy as np
+
+from conftest import kpis
+from src.result_cache import ResultCache, config_hash
+from src.simulation import Simulation
+
+
+def test_path_depends_on_config_and_run(config, tmp_path):
+    cache = ResultCache(tmp_path)
+    seed = np.random.SeedSequence(0, spawn_key=(1,))
+    changed = copy.deepcopy(config)
+    changed["resource quantities"]["checkouts"] += 1
+    assert cache.path(config, seed) == cache.path(copy.deepcopy(config), np.random.SeedSequence(0, spawn_key=(1,)))
+    assert cache.path(changed, seed) != cache.path(config, seed)
+    assert cache.path(config, np.random.SeedSequence(0, spawn_key=(2,))) != cache.path(config, seed)
+    assert cache.path(config, seed, common_random_numbers=True) != cache.path(config, seed)
+    assert cache.path(config, seed, True, False) != cache.path(config, seed, True, True)
+
+
+def test_flags_are_not_part_of_the_hash(config):
+    traced = copy.deepcopy(config)
+    traced["Customer"]["flags"]["print"] = True
+    assert config_hash(traced) == config_hash(config)
+
+
+def test_store_and_load(tmp_path):
+    cache = ResultCache(tmp_path)
+    path = cache.path({"Customer": {}}, 0)
+    assert cache.load(path) is None
+    cache.store(path, {"record": [1, 2, 3]})
+    assert cache.load(path) == {"record": [1, 2, 3]}
+    path.write_bytes(b"truncated")
+    assert cache.load(path) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(tmp_path)
+    paths = [cache.path({"Customer": {}}, seed) for seed in range(3)]
+    for time, path in enumerate(paths):
+        cache.store(path, np.zeros(100))
+        os.utime(path, (time, time))
+    cache.load(paths[0])  # used last now
+    cache.max_bytes = cache.size() - 1
+    cache.evict()
+    assert [path.exists() for path in paths] == [True, False, True]
+
+
+def test_invalidate(config, tmp_path):
+    cache = ResultCache(tmp_path)
+    other = copy.deepcopy(config)
+    other["resource quantities"]["baskets"] += 1
+    cache.store(cache.path(config, 0), 1)
+    cache.store(cache.path(other, 0), 2)
+    cache.invalidate(config)
+    assert cache.load(cache.path(config, 0)) is None
+    assert cache.load(cache.path(other, 0)) == 2
+    cache.invalidate()
+    assert cache.size() == 0
+
+
+def test_cached_runs_equal_fresh_runs(config, tmp_path):
+    fresh = Simulation(copy.deepcopy(config), runs=2, cache=tmp_path)
+    fresh.run()
+    cached = Simulation(copy.deepcopy(config), runs=2, cache=tmp_path)
+    cached.run()
+    assert len(cached.cache.entries()) == 2
+    assert [kpis(log) for log in cached.customerLog] == [kpis(log) for log in fresh.customerLog]
+
+
+def test_traced_runs_bypass_the_cache(config, tmp_path):
+    config["Customer"]["flags"]["trace"] = True
+    assert Simulation(config, runs=1, cache=tmp_path / "cache").cache is None
+    assert not (tmp_path / "cache").exists()
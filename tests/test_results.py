@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.results import CustomerTable
+from src.simulation import Simulation
+
+
+def customer(ucid, route="ABC", wait=None, use=None):
+    return SimpleNamespace(ucid=ucid, start_time=10.0 * ucid, exit_time=10.0 * ucid + 5.0, basket=ucid % 2 == 0,
+                           route=route, wait_times=wait or {}, use_times=use or {})
+
+
+def test_rows_in_order_of_exit():
+    table = CustomerTable(["container", "C", "checkout"])
+    table.add(customer(3, wait={"checkout": 2.0}, use={"checkout": 4.0}))
+    table.add(customer(1, route="CBA", wait={"C": 1.0}))
+    assert len(table) == 2
+    assert list(table.ucid[:2]) == [3, 1]
+    assert list(table.exit[:2]) == [35.0, 15.0]
+    assert list(table.basket[:2]) == [False, False]
+    assert [table.route_names[route] for route in table.route[:2]] == ["ABC", "CBA"]
+    assert np.array_equal(table.wait[:2], [[np.nan, np.nan, 2.0], [np.nan, 1.0, np.nan]], equal_nan=True)
+    assert np.array_equal(table.use[:2, 2], [4.0, np.nan], equal_nan=True)
+
+
+def test_table_grows_and_trims():
+    table = CustomerTable(["checkout"], capacity=1)
+    for ucid in range(5):
+        table.add(customer(ucid, wait={"checkout": float(ucid)}))
+    trimmed = table.trimmed()
+    assert len(table.ucid) >= 5 and len(trimmed.ucid) == 5
+    assert list(trimmed.ucid) == list(range(5))
+    assert list(trimmed.wait[:, 0]) == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+def test_day_table(config):
+    # a row per customer in order of exit, waits at the departments on the route and the checkout within the stay
+    simulation = Simulation(config, runs=1, seed=5)
+    simulation.run()
+    table = simulation.customerLog[0].customer_table
+    rows = slice(0, len(table))
+    assert np.all(np.diff(table.exit[rows]) >= 0)
+    assert len(np.unique(table.ucid[rows])) == len(table)
+    for key in ("C", "D"):
+        on_route = np.array([key in table.route_names[route] for route in table.route[rows]])
+        assert np.array_equal(~np.isnan(table.wait[rows, table.keys[key]]), on_route)
+    assert not np.isnan(table.wait[rows, table.keys["checkout"]]).any()
+    # the basket or cart is held from the entrance to the exit, the departments and the checkout are visited meanwhile
+    container = table.keys["container"]
+    assert table.wait[rows, container] + table.use[rows, container] == \
+        pytest.approx(table.exit[rows] - table.start[rows], rel=1e-9)
+    visits = np.nansum(np.delete(table.wait[rows] + table.use[rows], container, axis=1), axis=1)
+    assert np.all(visits <= table.use[rows, container] + 1e-9)
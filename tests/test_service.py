@@ -0,0 +1,68 @@
+import asyncio
+import copy
+import json
+
+import numpy as np
+import pytest
+
+import src.service as service
+from src.simulation import Simulation
+
+
+def failing_replication(config, *arguments):
+    raise RuntimeError("replication failed")
+
+
+def request(config, body):
+    """
+    start a service with one worker, send a single /simulate request and return the status and the JSON lines
+    """
+    async def exchange():
+        simulation_service = service.SimulationService(copy.deepcopy(config), workers=1, port=0)
+        server = await simulation_service.start()
+        try:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(f"POST /simulate HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        finally:
+            server.close()
+            simulation_service.pool.shutdown(cancel_futures=True)
+        head, _, content = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), [json.loads(line) for line in content.splitlines()]
+    return asyncio.run(exchange())
+
+
+def test_stream_matches_local_runs(config):
+    status, lines = request(config, json.dumps({"runs": 2, "seed": 4}).encode())
+    local = Simulation(copy.deepcopy(config), runs=2, seed=4, common_random_numbers=True)
+    local.run()
+    assert status == 200
+    assert [line["event"] for line in lines] == ["replication", "replication", "result"]
+    assert sorted(line["completed"] for line in lines[:2]) == [1, 2]
+    assert {line["run"]: line["store_time"] for line in lines[:2]} == \
+        {run: np.mean(local.customerLog[run].store_times) for run in range(2)}
+    assert lines[-1]["runs"] == 2 and lines[-1]["kpis"]
+
+
+@pytest.mark.parametrize("body, message", [
+    (b"{not json", "Expecting property name"),
+    (json.dumps({"runs": 0}).encode(), "at least one run is needed"),
+    (json.dumps({"overrides": {"resource quantities": {"checkouts": 0}}}).encode(),
+     "invalid overrides: ValueError: at least one regular checkout is needed"),
+    (json.dumps({"overrides": {"resource quantities": {"bread clerks": "x"}}}).encode(),
+     "invalid overrides: TypeError"),
+])
+def test_bad_requests_are_rejected(config, body, message):
+    status, (payload,) = request(config, body)
+    assert status == 400 and payload["error"].startswith(message)
+
+
+def test_failed_replication_ends_the_stream(config, monkeypatch):
+    # the workers are forked after the patch, the function is sent to them by reference
+    monkeypatch.setattr(service, "run_replication", failing_replication)
+    status, lines = request(config, json.dumps({"runs": 3}).encode())
+    assert status == 200
+    assert [line["event"] for line in lines] == ["error"]
+    assert lines[0]["error"] == "RuntimeError: replication failed" and lines[0]["run"] in range(3)
@@ -0,0 +1,28 @@
+import copy
+
+import pytest
+
+from conftest import kpis
+from src.simulation import Simulation
+
+
+def test_results_do_not_depend_on_workers(config):
+    sequential = Simulation(copy.deepcopy(config), runs=2, seed=3)
+    sequential.run()
+    parallel = Simulation(copy.deepcopy(config), runs=2, seed=3, workers=2)
+    parallel.run()
+    assert [kpis(log) for log in parallel.customerLog] == [kpis(log) for log in sequential.customerLog]
+
+
+def test_run_does_not_depend_on_runs_before(config):
+    both = Simulation(copy.deepcopy(config), runs=2, seed=3)
+    both.run()
+    second = Simulation(copy.deepcopy(config), runs=0, seed=3)
+    second.run_replications([1])
+    assert kpis(second.customerLog[0]) == kpis(both.customerLog[1])
+
+
+def test_fixed_seed_day(config, run_day):
+    # run r uses the r-th child of SeedSequence(seed), the results differ from the integer seeding used before
+    assert run_day(config, seed=0) == pytest.approx((91, 232919.57478389266, 3416.437871860202, 1760.2252250911397),
+                                                    rel=1e-9)
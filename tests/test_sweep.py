@@ -0,0 +1,56 @@
+import copy
+import csv
+
+import pytest
+
+from src.precision import confidence_interval
+from src.simulation import Simulation
+from src.sweep import SUMMARY_KPIS, ParameterSweep, apply_overrides, flatten_overrides, override_grid
+
+
+def test_override_grid():
+    assert override_grid({"bread clerks": [3, 4], "checkouts": [2, 5]}) == [
+        {"resource quantities": {"bread clerks": 3, "checkouts": 2}},
+        {"resource quantities": {"bread clerks": 3, "checkouts": 5}},
+        {"resource quantities": {"bread clerks": 4, "checkouts": 2}},
+        {"resource quantities": {"bread clerks": 4, "checkouts": 5}}]
+    assert override_grid({"basket": [0.5]}, section="Customer") == [{"Customer": {"basket": 0.5}}]
+
+
+def test_apply_overrides_merges_nested_values():
+    config = {"resource quantities": {"checkouts": 4, "baskets": 300}, "Customer": {"arrivals": [[0, 3.0]]}}
+    arrivals = [[0, 1.0]]
+    changed = apply_overrides(config, {"resource quantities": {"checkouts": 6}, "Customer": {"arrivals": arrivals}})
+    assert changed == {"resource quantities": {"checkouts": 6, "baskets": 300}, "Customer": {"arrivals": [[0, 1.0]]}}
+    assert config["resource quantities"]["checkouts"] == 4 and config["Customer"]["arrivals"] == [[0, 3.0]]
+    arrivals[0][1] = 2.0
+    assert changed["Customer"]["arrivals"] == [[0, 1.0]]  # the overrides are copied as well
+    assert flatten_overrides({"resource quantities": {"checkouts": 6}, "seed": 1}) == \
+        {"resource quantities.checkouts": 6, "seed": 1}
+
+
+def test_sweep_table_matches_serial_runs(config, tmp_path):
+    scenarios = override_grid({"checkouts": [2, 4]})
+    sweep = ParameterSweep(config, scenarios, replications=2, workers=2, seed=3, confidence=0.9)
+    rows = sweep.run()
+    assert len(rows) == len(scenarios) * len(SUMMARY_KPIS)
+    assert all(list(row.keys()) == ["scenario", "resource quantities.checkouts", "kpi", "key", "runs", "mean",
+                                    "half_width"] for row in rows)
+
+    for s, overrides in enumerate(scenarios):
+        serial = Simulation(apply_overrides(copy.deepcopy(config), overrides), runs=2, seed=3,
+                            common_random_numbers=True)
+        serial.run()
+        for kpi, key in SUMMARY_KPIS:
+            assert sweep.simulations[s].replication_values(kpi, key).tolist() == \
+                pytest.approx(serial.replication_values(kpi, key).tolist(), nan_ok=True)
+        row, = [row for row in rows if row["scenario"] == s and row["kpi"] == "store_times"]
+        assert row["resource quantities.checkouts"] == overrides["resource quantities"]["checkouts"]
+        assert row["runs"] == 2
+        assert (row["mean"], row["half_width"]) == \
+            pytest.approx(confidence_interval(serial.estimation_values("store_times"), 0.9))
+
+    sweep.save_csv(tmp_path / "sweep.csv")
+    with open(tmp_path / "sweep.csv", newline="") as file:
+        saved = list(csv.DictReader(file))
+    assert len(saved) == len(rows) and float(saved[0]["mean"]) == pytest.approx(rows[0]["mean"])
@@ -0,0 +1,40 @@
+import simpy
+
+from src.TracedResource import TracedResource
+
+
+class Customer:
+    pass
+
+
+def test_added_capacity_serves_waiting_requests():
+    env = simpy.Environment()
+    resource = TracedResource(env, capacity=1)
+    customers = [Customer() for _ in range(5)]
+    requests = [resource.request(customer) for customer in customers]
+    env.run()
+    resource.add_capacity(2)
+    env.run()
+    assert resource.capacity == 3 and resource.count == 3
+    assert [request.triggered for request in requests] == [True, True, True, False, False]
+    assert all(resource.is_served(customer) for customer in customers[:3])
+    assert resource.position(customers[3]) == 3
+
+    resource.release(requests[0], customers[0])
+    env.run()
+    assert requests[3].triggered and resource.count == 3 and len(resource.put_queue) == 1
+
+
+def test_availability_follows_the_capacity_timeline():
+    env = simpy.Environment()
+    resource = TracedResource(env, capacity=1)
+    customers = [Customer() for _ in range(3)]
+    for customer in customers:
+        resource.request(customer)
+    env.run(until=10)
+    resource.add_capacity(2)
+    env.run()
+    available, time = resource.availability()
+    assert resource.capacity_log == [(0, 1), (10, 3)]
+    assert available[time < 10].tolist() == [0, -1, -2]
+    assert available[-1] == 0 and time[-1] == 10